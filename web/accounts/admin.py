@@ -1,10 +1,22 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from emails.outbox import enqueue_emails
+from .forms import InviteUsersForm
+from .invitations import activation_emails, invite_users, parse_invitations
 from .models import User
 
 
 class CustomUserAdmin(UserAdmin):
     list_display = ['email', 'username', ]
+    actions = ['resend_activation_links']
     fieldsets = (
         (None, {
             'fields': ('username', 'first_name', 'last_name', 'email', 'password', )
@@ -21,5 +33,36 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+    def get_urls(self):
+        return [
+            path('invite/', self.admin_site.admin_view(self.invite_view), name='accounts_user_invite'),
+        ] + super().get_urls()
+
+    def invite_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = InviteUsersForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            csv_file = io.TextIOWrapper(form.cleaned_data['csv_file'], encoding='utf-8-sig')
+            try:
+                rows = parse_invitations(csv_file)
+            except ValidationError as e:
+                for message in e.messages:
+                    form.add_error('csv_file', message)
+            else:
+                users = invite_users(rows, get_current_site(request).domain)
+                self.message_user(request, f'Invited {len(users)} users', messages.SUCCESS)
+                return HttpResponseRedirect(reverse('admin:accounts_user_changelist'))
+
+        context = {**self.admin_site.each_context(request), 'form': form, 'opts': self.model._meta, 'title': 'Invite users'}
+        return TemplateResponse(request, 'admin/accounts/user/invite.html', context)
+
+    @admin.action(description='Resend activation links to selected inactive users')
+    def resend_activation_links(self, request, queryset):
+        inactive_users = queryset.filter(is_active=False)
+        inactive_users.update(token_generated_timestamp=timezone.now())
+        emails = enqueue_emails(activation_emails(inactive_users, get_current_site(request).domain))
+        self.message_user(request, f'Queued {len(emails)} activation emails', messages.SUCCESS)
+
 
 admin.site.register(User, CustomUserAdmin)
@@ -0,0 +1,57 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from errander.db.replicas import replica_reads
+
+GENERATION_CACHE_KEY = 'accounts:perms:generation'
+
+
+def permission_cache_key(user_id):
+    return f'accounts:perms:{user_id}'
+
+
+def invalidate_user_permissions(*user_ids):
+    cache.delete_many([permission_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate_all_permissions():
+    cache.set(GENERATION_CACHE_KEY, time.time_ns(), None)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Keeps each user's permission set in the shared cache so that permission
+    checks on a fresh request do not query the user and group permission tables.
+    Group edits bump a generation that invalidates every cached set at once.
+    Without REDIS_URL the sets are read from the primary on every request, as
+    revoking a permission could not reach other processes' local caches.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not settings.REDIS_URL:
+            with replica_reads(False):
+                return super().get_all_permissions(user_obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk)
+            cached = cache.get_many([key, GENERATION_CACHE_KEY])
+            generation = cached.get(GENERATION_CACHE_KEY)
+            entry = cached.get(key)
+            if entry is not None and generation is not None and entry[0] == generation:
+                user_obj._perm_cache = entry[1]
+            else:
+                if generation is None:
+                    generation = cache.get_or_set(GENERATION_CACHE_KEY, time.time_ns, None)
+                with replica_reads(False):
+                    permissions = super().get_all_permissions(user_obj)
+                cache.set(key, (generation, permissions), settings.PERMISSION_CACHE_TIMEOUT)
+        return user_obj._perm_cache
+
+
+def permission_version(user):
+    permissions = ','.join(sorted(user.get_all_permissions()))
+    return hashlib.md5(permissions.encode(), usedforsecurity=False).hexdigest()[:12]
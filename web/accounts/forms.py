@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import User
 
@@ -6,3 +7,11 @@ class SignupForm(UserCreationForm):
     class Meta:
         model = User
         fields = ('username', 'email', 'password1', 'password2')
+
+
+class InviteUsersForm(forms.Form):
+    csv_file = forms.FileField(label='CSV file')
+
+
+class UserFilterForm(forms.Form):
+    q = forms.CharField(max_length=150, required=False, label='Search')
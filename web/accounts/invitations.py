@@ -0,0 +1,121 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from emails.outbox import enqueue_emails
+from emails.tokens import TokenGenerator
+
+from .models import User
+
+INVITATION_COLUMNS = ('username', 'email', 'password')
+ACTIVATION_MAIL_SUBJECT = 'Activation link has been sent to your email id'
+
+
+def _validate_row(line, row):
+    errors = []
+    username, email, password = (row.get(column, '').strip() for column in INVITATION_COLUMNS)
+    for column in INVITATION_COLUMNS:
+        if not row.get(column, '').strip():
+            errors.append(f'line {line}: {column} is required')
+    if errors:
+        return errors
+
+    checks = [
+        (User.username_validator, username),
+        (validate_email, email),
+        (lambda value: validate_password(value, User(username=username, email=email)), password),
+    ]
+    for validator, value in checks:
+        try:
+            validator(value)
+        except ValidationError as e:
+            errors.extend(f'line {line}: {message}' for message in e.messages)
+    return errors
+
+
+def parse_invitations(csv_file):
+    """
+    Reads and validates every row before anything is written, raising a
+    ValidationError listing all problems found in the file.
+    """
+    try:
+        return _parse_rows(csv.DictReader(csv_file))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValidationError(f'File is not a valid UTF-8 CSV file: {e}')
+
+
+def _parse_rows(reader):
+    missing = set(INVITATION_COLUMNS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValidationError(f'Missing columns: {", ".join(sorted(missing))}')
+
+    rows, errors = [], []
+    usernames, emails = {}, {}
+    for line, row in enumerate(reader, start=2):
+        errors.extend(_validate_row(line, row))
+        username, email = row.get('username', '').strip(), row.get('email', '').strip()
+        if username in usernames:
+            errors.append(f'line {line}: username {username} repeats line {usernames[username]}')
+        if email in emails:
+            errors.append(f'line {line}: email {email} repeats line {emails[email]}')
+        usernames.setdefault(username, line)
+        emails.setdefault(email, line)
+        rows.append({'username': username, 'email': email, 'password': row.get('password', '').strip()})
+
+    if not rows:
+        errors.append('File contains no users')
+    taken_usernames = User.objects.filter(username__in=usernames).values_list('username', flat=True)
+    errors.extend(f'line {usernames[username]}: username {username} is already taken' for username in taken_usernames)
+    taken_emails = User.objects.filter(email__in=emails).values_list('email', flat=True)
+    errors.extend(f'line {emails[email]}: email {email} is already taken' for email in taken_emails)
+
+    if errors:
+        raise ValidationError(errors)
+    return rows
+
+
+def _setup_worker():
+    if not settings.configured:
+        django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    workers = workers or settings.INVITATION_HASH_WORKERS
+    if workers < 2 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as executor:
+        return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def activation_emails(users, domain):
+    token_generator = TokenGenerator()
+    for user in users:
+        body = render_to_string('acc_active_email.html', {
+            'user': user,
+            'domain': domain,
+            'uid': token_generator.make_uid(user),
+            'token': token_generator.make_token(user),
+        })
+        yield ACTIVATION_MAIL_SUBJECT, body, [user.email]
+
+
+def invite_users(rows, domain, workers=None):
+    hashes = hash_passwords([row['password'] for row in rows], workers=workers)
+    users = [
+        User(username=row['username'], email=row['email'], password=password_hash, is_active=False)
+        for row, password_hash in zip(rows, hashes)
+    ]
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(users)
+        enqueue_emails(activation_emails(users, domain))
+    return users
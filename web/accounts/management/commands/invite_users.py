@@ -0,0 +1,23 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.invitations import invite_users, parse_invitations
+
+
+class Command(BaseCommand):
+    help = 'Create inactive users from a CSV file with username, email and password columns and email them activation links'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--domain', required=True, help='Domain used in activation links')
+        parser.add_argument('--workers', type=int, help='Password hashing processes')
+
+    def handle(self, *args, **options):
+        with open(options['csv_file'], newline='', encoding='utf-8-sig') as csv_file:
+            try:
+                rows = parse_invitations(csv_file)
+            except ValidationError as e:
+                raise CommandError('\n'.join(e.messages))
+
+        users = invite_users(rows, options['domain'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Invited {len(users)} users'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Delete users who did not activate their account before the activation link expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        expired = User.objects.filter(
+            is_active=False,
+            token_generated_timestamp__lte=timezone.now() - User.TOKEN_LIFETIME,
+            account_activation_timestamp__isnull=True,
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} expired users would be deleted')
+            return
+
+        deleted = 0
+        while True:
+            # every chunk is a separate short transaction
+            with transaction.atomic():
+                ids = list(
+                    expired.order_by('token_generated_timestamp', 'id')
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', flat=True)[:options['chunk_size']]
+                )
+                if not ids:
+                    break
+                User.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired users'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.5 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'token_generated_timestamp'], name='user_activation_expiry_idx'),
+        ),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 import datetime
 from django.utils import timezone
 
 
 class User(AbstractUser):
+    TOKEN_LIFETIME = datetime.timedelta(days=1)
+
     email = models.EmailField(blank=False, null=False, unique=True, max_length=254, verbose_name='email address')
     token_generated_timestamp = models.DateTimeField(auto_now_add=True)
     account_activation_timestamp = models.DateTimeField(null=True)
@@ -15,9 +19,15 @@ class User(AbstractUser):
             ('view_index', 'User can view index of all app users'),
             ('view_any_user', 'User can view any user in profile page')
         ]
+        indexes = [
+            models.Index(fields=['is_active', 'token_generated_timestamp'], name='user_activation_expiry_idx'),
+            # icontains compiles to UPPER(column) LIKE UPPER(...), so the trigram indexes cover UPPER(column)
+            GinIndex(OpClass(Upper('username'), name='gin_trgm_ops'), name='user_username_trgm_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.username
 
     def token_expired(self):
-        return self.token_generated_timestamp <= timezone.now() - datetime.timedelta(days=1)
+        return self.token_generated_timestamp <= timezone.now() - self.TOKEN_LIFETIME
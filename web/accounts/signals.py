@@ -0,0 +1,39 @@
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_all_permissions, invalidate_user_permissions
+from .models import User
+
+
+def invalidate(func, *args):
+    func(*args)
+    if transaction.get_connection().in_atomic_block:
+        # a request may refill the cache from the old rows before the change commits
+        transaction.on_commit(lambda: func(*args))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    invalidate(invalidate_user_permissions, instance.pk)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate(invalidate_user_permissions, instance.pk)
+    elif pk_set:
+        invalidate(invalidate_user_permissions, *pk_set)
+    else:
+        invalidate(invalidate_all_permissions)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def group_permissions_changed(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate(invalidate_all_permissions)
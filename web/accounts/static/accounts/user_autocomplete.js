@@ -0,0 +1,58 @@
+// plain JS so the picker also works in the Django admin, which has no global $
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-autocomplete-url]').forEach(function (select) {
+        var url = select.dataset.autocompleteUrl;
+        var input = document.createElement('input');
+        var results = document.createElement('div');
+        var more = document.createElement('button');
+        var next = null;
+        var timer = null;
+
+        input.type = 'search';
+        input.className = 'form-control mb-2';
+        input.placeholder = 'Search users';
+        results.className = 'list-group mb-2';
+        more.type = 'button';
+        more.className = 'btn btn-secondary btn-sm mb-2 d-none';
+        more.textContent = 'More users';
+        select.before(input, results, more);
+
+        function addUser(user) {
+            var option = Array.from(select.options).find(function (o) { return o.value === String(user.id); });
+            if (option === undefined) {
+                option = new Option(user.username, user.id, true, true);
+                select.add(option);
+            }
+            option.selected = true;
+        }
+
+        function search(cursor) {
+            var params = new URLSearchParams({q: input.value});
+            if (cursor) {
+                params.set('after', cursor);
+            } else {
+                results.replaceChildren();
+            }
+            fetch(url + '?' + params.toString(), {credentials: 'same-origin'})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    data.results.forEach(function (user) {
+                        var button = document.createElement('button');
+                        button.type = 'button';
+                        button.className = 'list-group-item list-group-item-action';
+                        button.textContent = user.username + ' (' + user.email + ')';
+                        button.addEventListener('click', function () { addUser(user); });
+                        results.append(button);
+                    });
+                    next = data.next;
+                    more.classList.toggle('d-none', next === null);
+                });
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { search(null); }, 250);
+        });
+        more.addEventListener('click', function () { search(next); });
+    });
+});
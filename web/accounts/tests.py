@@ -1,15 +1,27 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from accounts.models import User
+from errands.models import Errand
 from django.contrib.auth import authenticate, login
 from emails.tokens import TokenGenerator
 import datetime
 from django.utils import timezone
 from django.urls import reverse
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.views import PasswordChangeForm, PasswordResetForm
 from django.contrib.contenttypes.models import ContentType
 from .forms import SignupForm
 from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from .invitations import parse_invitations
+from .backends import GENERATION_CACHE_KEY, permission_cache_key
+from django.core.cache import cache
+import os
+import tempfile
+from emails.models import QueuedEmail
+import io
 from django.contrib.auth.tokens import default_token_generator
 
 
@@ -20,6 +32,21 @@ def assign_perm_to_user(model, user, perm):
     user.save()
 
 
+def search_plan(sql):
+    with connection.cursor() as cursor:
+        # rule out a full scan and the ordered walk of the username btree, leaving the trigram indexes
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_indexscan = off')
+        cursor.execute(f'EXPLAIN {sql}')
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def assign_errands(user, errands):
+    Errand.assigned_users.through.objects.bulk_create(
+        Errand.assigned_users.through(errand=errand, user=user) for errand in errands
+    )
+
+
 user1_data = {
     'username': 'user1',
     'email': 'user1@example-email.com',
@@ -140,6 +167,9 @@ class EmailRegistrationAndAccountActivationTest(TestCase):
         )
         response = self.client.post(reverse('accounts:signup'), user2_data, follow=True)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(QueuedEmail.objects.filter(to=[user2_data['email']]).count(), 1)
+        call_command('send_queued_mail', stdout=io.StringIO())
         self.assertEqual(len(mail.outbox), 1)
         user2 = User.objects.get(username=user2_data['username'])
         uid = TokenGenerator().make_uid(user2)
@@ -236,6 +266,40 @@ class EmailRegistrationAndAccountActivationTest(TestCase):
         self.assertEqual(str(messages[0]), 'Token expired, ask your manager for new link')
 
 
+class PurgeExpiredUsersTest(TestCase):
+    def setUp(self):
+        old = timezone.now() - datetime.timedelta(days=2)
+        self.expired = User.objects.bulk_create(
+            User(username=f'expired{i}', email=f'expired{i}@example-email.com', is_active=False) for i in range(5)
+        )
+        self.pending = User.objects.create(username='pending', email='pending@example-email.com', is_active=False)
+        self.active = User.objects.create(username='active', email='active@example-email.com')
+        self.deactivated = User.objects.create(
+            username='deactivated', email='deactivated@example-email.com',
+            is_active=False, account_activation_timestamp=old
+        )
+        User.objects.exclude(pk=self.pending.pk).update(token_generated_timestamp=old)
+        assign_errands(self.expired[0], [Errand.objects.create(name='errand', description='errand')])
+
+    def test_expired_users_are_deleted_in_chunks(self):
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_expired_users', chunk_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired users', out.getvalue())
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)),
+            {'pending', 'active', 'deactivated'}
+        )
+        self.assertFalse(Errand.assigned_users.through.objects.exists())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SAVEPOINT')]), 4)
+
+    def test_dry_run_does_not_delete(self):
+        out = io.StringIO()
+        call_command('purge_expired_users', dry_run=True, stdout=out)
+        self.assertIn('5 expired users would be deleted', out.getvalue())
+        self.assertEqual(User.objects.count(), 8)
+
+
 class FormsTest(TestCase):
 
     def setUp(self):
@@ -438,6 +502,208 @@ class FormsTest(TestCase):
         self.assertFalse(pswd_change_form.is_valid())
 
 
+# the local memory cache stands in for the shared Redis cache
+@override_settings(REDIS_URL='redis://redis:6379/0')
+class PermissionCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=user1_data['username'],
+            email=user1_data['email'],
+            password=user1_data['password1'],
+        )
+        self.group = Group.objects.create(name='dispatchers')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_permissions_are_cached_across_requests(self):
+        assign_perm_to_user(User, self.user, 'view_index')
+        self.assertTrue(self.fresh_user().has_perm('accounts.view_index'))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('accounts.view_index'))
+            self.assertFalse(user.has_perm('accounts.register_user'))
+
+    def test_user_permission_changes_invalidate_cache(self):
+        self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+        assign_perm_to_user(User, self.user, 'view_index')
+        self.assertTrue(self.fresh_user().has_perm('accounts.view_index'))
+
+        permission = Permission.objects.get(codename='view_index')
+        permission.user_set.remove(self.user)
+        self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+
+    def test_cache_refilled_before_commit_is_invalidated_on_commit(self):
+        self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            assign_perm_to_user(User, self.user, 'view_index')
+            # stands in for a concurrent request still reading the uncommitted rows
+            cache.set(permission_cache_key(self.user.pk), (cache.get(GENERATION_CACHE_KEY), set()))
+            self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+        self.assertTrue(self.fresh_user().has_perm('accounts.view_index'))
+
+    def test_group_changes_invalidate_cache(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(self.fresh_user().has_perm('accounts.register_user'))
+
+        self.group.permissions.add(Permission.objects.get(codename='register_user'))
+        self.assertTrue(self.fresh_user().has_perm('accounts.register_user'))
+
+        self.group.user_set.clear()
+        self.assertFalse(self.fresh_user().has_perm('accounts.register_user'))
+
+    def test_inactive_users_have_no_permissions(self):
+        assign_perm_to_user(User, self.user, 'view_index')
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+
+    @override_settings(REDIS_URL=None)
+    def test_permissions_are_not_cached_without_a_shared_cache(self):
+        assign_perm_to_user(User, self.user, 'view_index')
+        self.assertTrue(self.fresh_user().has_perm('accounts.view_index'))
+        self.assertIsNone(cache.get(permission_cache_key(self.user.pk)))
+
+        Permission.objects.get(codename='view_index').user_set.remove(self.user)
+        # a revocation must not depend on reaching this process' local cache
+        cache.set(permission_cache_key(self.user.pk), (cache.get(GENERATION_CACHE_KEY), {'accounts.view_index'}))
+        self.assertFalse(self.fresh_user().has_perm('accounts.view_index'))
+
+
+class InviteUsersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=user1_data['username'],
+            email=user1_data['email'],
+            password=user1_data['password1'],
+        )
+        self.csv = (
+            'username,email,password\n'
+            'courier1,courier1@example-email.com,verysecret1@\n'
+            'courier2,courier2@example-email.com,verysecret2@\n'
+            'courier3,courier3@example-email.com,verysecret3@\n'
+        )
+
+    def write_csv(self, content):
+        csv_file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        csv_file.write(content)
+        csv_file.close()
+        self.addCleanup(os.remove, csv_file.name)
+        return csv_file.name
+
+    def test_all_rows_are_validated_before_anything_is_created(self):
+        content = (
+            'username,email,password\n'
+            f'{user1_data["username"]},new@example-email.com,verysecret1@\n'
+            'courier1,not-an-email,verysecret1@\n'
+            'courier2,courier2@example-email.com,123\n'
+            'courier2,courier3@example-email.com,verysecret3@\n'
+        )
+        with self.assertRaises(ValidationError) as error:
+            parse_invitations(io.StringIO(content))
+        messages = error.exception.messages
+        self.assertIn(f'line 2: username {user1_data["username"]} is already taken', messages)
+        self.assertIn('line 3: Enter a valid email address.', messages)
+        self.assertTrue(any(message.startswith('line 4: This password is too short') for message in messages))
+        self.assertIn('line 5: username courier2 repeats line 4', messages)
+
+        with self.assertRaises(CommandError):
+            call_command('invite_users', self.write_csv(content), domain='testserver', stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_invite_users_command_creates_inactive_users_and_queues_activation_links(self):
+        out = io.StringIO()
+        call_command('invite_users', self.write_csv(self.csv), domain='testserver', workers=2, stdout=out)
+        self.assertIn('Invited 3 users', out.getvalue())
+
+        user = User.objects.get(username='courier2')
+        self.assertFalse(user.is_active)
+        self.assertTrue(user.check_password('verysecret2@'))
+        email = QueuedEmail.objects.get(to=[user.email])
+        uid = TokenGenerator().make_uid(user)
+        self.assertIn(f'http://testserver/accounts/activate/{uid}/', email.body)
+
+        token = email.body.strip().rsplit('/', 1)[1]
+        response = self.client.get(reverse('accounts:activate', kwargs={'uidb64': uid, 'token': token}))
+        self.assertEqual(response.status_code, 302)
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+
+    def test_admin_can_upload_invitations(self):
+        User.objects.create_superuser(username='admin', email='admin@example-email.com', password='verysecretadmin1@')
+        self.client.login(username='admin', password='verysecretadmin1@')
+        csv_file = io.BytesIO(self.csv.encode())
+        csv_file.name = 'crew.csv'
+        response = self.client.post(reverse('admin:accounts_user_invite'), {'csv_file': csv_file})
+        self.assertRedirects(response, reverse('admin:accounts_user_changelist'))
+        self.assertEqual(User.objects.filter(username__startswith='courier', is_active=False).count(), 3)
+        self.assertEqual(QueuedEmail.objects.count(), 3)
+
+        response = self.client.post(reverse('admin:accounts_user_changelist'), {
+            'action': 'resend_activation_links',
+            '_selected_action': list(User.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(QueuedEmail.objects.count(), 6)
+
+    def test_admin_reports_undecodable_uploads_as_form_errors(self):
+        User.objects.create_superuser(username='admin', email='admin@example-email.com', password='verysecretadmin1@')
+        self.client.login(username='admin', password='verysecretadmin1@')
+        csv_file = io.BytesIO(self.csv.encode('utf-16'))
+        csv_file.name = 'crew.csv'
+        response = self.client.post(reverse('admin:accounts_user_invite'), {'csv_file': csv_file})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'File is not a valid UTF-8 CSV file')
+        self.assertFalse(User.objects.filter(username__startswith='courier').exists())
+
+
+class UserAutocompleteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=user1_data['username'],
+            email=user1_data['email'],
+            password=user1_data['password1'],
+        )
+        User.objects.bulk_create(User(username=f'courier{i:02}', email=f'c{i}@example-email.com') for i in range(25))
+
+    def test_users_without_assign_permission_cant_search_users(self):
+        self.client.login(username=user1_data['username'], password=user1_data['password1'])
+        response = self.client.get(reverse('accounts:autocomplete'), {'q': 'courier'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_autocomplete_returns_paged_matches(self):
+        assign_perm_to_user(Errand, self.user, 'assign_users')
+        self.client.login(username=user1_data['username'], password=user1_data['password1'])
+        response = self.client.get(reverse('accounts:autocomplete'), {'q': 'COURIER'})
+        first_page = response.json()
+        self.assertEqual(len(first_page['results']), 20)
+        self.assertEqual(first_page['results'][0]['username'], 'courier00')
+
+        response = self.client.get(reverse('accounts:autocomplete'), {'q': 'courier', 'after': first_page['next']})
+        second_page = response.json()
+        self.assertEqual([user['username'] for user in second_page['results']], [f'courier{i}' for i in range(20, 25)])
+        self.assertIsNone(second_page['next'])
+
+        response = self.client.get(reverse('accounts:autocomplete'), {'q': 'c3@example'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['courier03'])
+
+    def test_search_uses_trigram_indexes(self):
+        assign_perm_to_user(Errand, self.user, 'assign_users')
+        self.client.login(username=user1_data['username'], password=user1_data['password1'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('accounts:autocomplete'), {'q': 'courier'})
+        search = next(query['sql'] for query in queries if 'LIKE' in query['sql'])
+        plan = search_plan(search)
+        self.assertIn('user_username_trgm_idx', plan)
+        self.assertIn('user_email_trgm_idx', plan)
+
+    def test_invalid_cursor_is_rejected(self):
+        assign_perm_to_user(Errand, self.user, 'create')
+        self.client.login(username=user1_data['username'], password=user1_data['password1'])
+        response = self.client.get(reverse('accounts:autocomplete'), {'after': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
 class UserProfilePageTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -470,12 +736,73 @@ class UserProfilePageTest(TestCase):
         self.assertEqual(response.context['object'].username, self.user.username)
         self.assertNotEqual(response.context['object'].username, self.user_can_view_other_users.username)
 
+    def test_profile_answers_conditional_requests(self):
+        self.client.login(username=user2_data['username'], password=user2_data['password1'])
+        Errand.objects.create(name='errand', description='errand')
+        etag = self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}))['ETag']
+        response = self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.user.email = 'changed@example-email.com'
+        self.user.save()
+        response = self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
     def test_users_with_correct_permission_can_view_other_users_profile_page(self):
         self.client.login(username=user2_data['username'], password=user2_data['password1'])
         response = self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}), follow=True)
         self.assertEqual(response.context['object'].username, self.user.username)
 
 
+class UserProfileErrandsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username=user1_data['username'],
+            email=user1_data['email'],
+            password=user1_data['password1'],
+        )
+        errands = Errand.objects.bulk_create(
+            Errand(name=f'errand {i}', description='errand', status=status)
+            for i, status in enumerate([3] * 20 + [1] * 15 + [4] * 5)
+        )
+        assign_errands(self.user, errands)
+        self.client.login(username=user1_data['username'], password=user1_data['password1'])
+
+    def test_profile_errands_are_paginated_and_grouped_by_status(self):
+        response = self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}))
+        errands = response.context['errands']
+        self.assertEqual(len(errands), 25)
+        self.assertEqual([errand.status for errand in errands], [1] * 15 + [3] * 10)
+        self.assertEqual(
+            response.context['status_counts'],
+            [('Discarded', 0), ('Pending', 15), ('Accepted', 0), ('In progress', 20), ('Done', 5)]
+        )
+
+        response = self.client.get(
+            reverse('accounts:profile', kwargs={'pk': self.user.id}),
+            {'after': response.context['page_obj'].next_cursor}
+        )
+        self.assertEqual([errand.status for errand in response.context['errands']], [3] * 10 + [4] * 5)
+
+    def test_profile_query_count_does_not_depend_on_errands(self):
+        def count_profile_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}))
+            return len(queries)
+
+        count_profile_queries()
+        queries = count_profile_queries()
+        assign_errands(self.user, Errand.objects.bulk_create(
+            Errand(name='errand', description='errand', status=2) for i in range(30)
+        ))
+        self.assertEqual(count_profile_queries(), queries)
+
+    def test_own_profile_does_not_look_up_the_user_again(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('accounts:profile', kwargs={'pk': self.user.id}))
+        self.assertEqual(len([query for query in queries if 'FROM "accounts_user"' in query['sql']]), 1)
+
+
 class UserIndexTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -524,6 +851,58 @@ class UserIndexTest(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class UserIndexPaginationTest(TestCase):
+    def setUp(self):
+        self.user_can_view_index = User.objects.create_user(
+            username=user2_data['username'],
+            email=user2_data['email'],
+            password=user2_data['password1'],
+        )
+        assign_perm_to_user(User, self.user_can_view_index, 'view_index')
+        self.couriers = User.objects.bulk_create(
+            User(username=f'courier{i:02}', email=f'c{i}@example-email.com') for i in range(60)
+        )
+        for status in (1, 1, 3, 4):
+            Errand.objects.create(name='errand', description='errand', status=status).assigned_users.add(self.couriers[0])
+        self.client.login(username=user2_data['username'], password=user2_data['password1'])
+
+    def test_index_is_paginated_by_username(self):
+        response = self.client.get(reverse('accounts:index'))
+        users = response.context['users']
+        self.assertEqual(len(users), 50)
+        self.assertEqual(users[0].username, 'courier00')
+
+        response = self.client.get(reverse('accounts:index'), {'after': response.context['page_obj'].next_cursor})
+        self.assertEqual(
+            [user.username for user in response.context['users']],
+            [f'courier{i}' for i in range(50, 60)] + [user2_data['username']]
+        )
+
+    def test_index_shows_errand_counts_per_status(self):
+        response = self.client.get(reverse('accounts:index'), {'q': 'courier00'})
+        self.assertEqual([user.username for user in response.context['users']], ['courier00'])
+        self.assertEqual(response.context['users'][0].errand_counts, [0, 2, 0, 1, 1])
+
+    def test_index_search_uses_trigram_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('accounts:index'), {'q': 'courier'})
+        plan = search_plan(next(query['sql'] for query in queries if 'LIKE' in query['sql']))
+        self.assertIn('user_username_trgm_idx', plan)
+        self.assertIn('user_email_trgm_idx', plan)
+
+    def test_index_query_count_does_not_depend_on_users(self):
+        def count_index_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('accounts:index'))
+            return len(queries)
+
+        count_index_queries()
+        queries = count_index_queries()
+        for courier in self.couriers[1:10]:
+            Errand.objects.create(name='errand', description='errand').assigned_users.add(courier)
+        self.assertEqual(count_index_queries(), queries)
+
+
 class UserPasswordChangeTest(TestCase):
 
     def setUp(self):
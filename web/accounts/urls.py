@@ -7,6 +7,7 @@ urlpatterns = [
     path('logout_user/', views.logout_user, name='logout_user'),
     path('signup/', views.signup, name='signup'),
     path('activate/<uidb64>/<token>', views.activate, name='activate'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('', views.UserIndexView.as_view(), name='index'),
     path('<int:pk>/', views.UserDetailView.as_view(), name='profile'),
 ]
@@ -3,46 +3,132 @@ from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.utils.decorators import method_decorator
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
 from django.urls import reverse
-from .forms import SignupForm
+from .forms import SignupForm, UserFilterForm
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from django.template.loader import render_to_string
 from emails.tokens import TokenGenerator
-from django.core.mail import EmailMessage
+from emails.outbox import enqueue_email
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import generic
 from .models import User
 from django.utils import timezone
+from django.db.models import Count, Q, Subquery
+from errander.conditional import conditional_page
+from errander.db.replicas import use_replica
+from errander.pagination import KeysetPaginationMixin, KeysetPaginator
+from errands.models import Errand
 
 
-class UserIndexView(LoginRequiredMixin, generic.ListView):
+def search_users(queryset, query):
+    """Shared by the user index and autocomplete; served by the UPPER() trigram indexes on User."""
+    return queryset.filter(Q(username__icontains=query) | Q(email__icontains=query))
+
+
+@method_decorator(use_replica, name='dispatch')
+class UserIndexView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     template_name = 'accounts/index.html'
     context_object_name = 'users'
+    paginate_by = 50
+    keyset_ordering = ('username',)
 
     def get_queryset(self):
-        return User.objects.all()
+        queryset = User.objects.only('id', 'username', 'email').annotate(**{
+            f'errands_{status}': Count('errand', filter=Q(errand__status=status))
+            for status, label in Errand.STATUSES
+        })
+
+        self.filter_form = UserFilterForm(self.request.GET)
+        if self.filter_form.is_valid() and self.filter_form.cleaned_data['q']:
+            queryset = search_users(queryset, self.filter_form.cleaned_data['q'])
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        context['statuses'] = Errand.STATUSES
+        for user in context['users']:
+            user.errand_counts = [getattr(user, f'errands_{status}') for status, label in Errand.STATUSES]
+        return context
 
     @method_decorator(permission_required('accounts.view_index', raise_exception=True))
     def dispatch(self, *args, **kwargs):
         return super(UserIndexView, self).dispatch(*args, **kwargs)
 
 
+def profile_change(request, pk):
+    latest_history = Errand.history.order_by('-history_date')
+    if pk == request.user.id or not request.user.has_perm('accounts.view_any_user'):
+        latest = latest_history.values_list('history_date', 'history_id').first()
+        profile = latest and (request.user.username, request.user.email, *latest)
+    else:
+        profile = User.objects.filter(pk=pk).annotate(
+            latest_change=Subquery(latest_history.values('history_date')[:1]),
+            latest_history_id=Subquery(latest_history.values('history_id')[:1]),
+        ).values_list('username', 'email', 'latest_change', 'latest_history_id').first()
+    if profile is None or profile[2] is None:
+        return None
+    username, email, latest_change, latest_history_id = profile
+    return latest_change, f'{username}:{email}:{latest_history_id}'
+
+
+@method_decorator(use_replica, name='dispatch')
+@conditional_page(profile_change)
 class UserDetailView(LoginRequiredMixin, generic.DetailView):
     model = User
     template_name = 'accounts/profile.html'
+    errands_paginate_by = 25
+
+    def get_object(self, queryset=None):
+        if self.kwargs['pk'] == self.request.user.id or not self.request.user.has_perm('accounts.view_any_user'):
+            return self.request.user
+        return get_object_or_404(User, pk=self.kwargs['pk'])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['object'] = get_object_or_404(User, pk=self.request.user.id)
-        if self.request.user.has_perm('accounts.view_any_user'):
-            context['object'] = get_object_or_404(User, pk=self.kwargs['pk'])
+        errands = Errand.objects.filter(assigned_users=self.object)
+
+        paginator = KeysetPaginator(errands.only('id', 'name', 'description', 'status'), self.errands_paginate_by, ordering=('status', 'id'))
+        try:
+            context['page_obj'] = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        context['errands'] = context['page_obj'].object_list
+        context['pagination_query'] = ''
+
+        counts = dict(errands.values_list('status').annotate(count=Count('id')).order_by())
+        context['status_counts'] = [(label, counts.get(status, 0)) for status, label in Errand.STATUSES]
         return context
 
 
+@login_required
+def autocomplete(request):
+    if not (request.user.has_perm('errands.assign_users') or request.user.has_perm('errands.create')):
+        raise PermissionDenied
+
+    users = User.objects.only('id', 'username', 'email')
+    query = request.GET.get('q', '').strip()[:150]
+    if query:
+        users = search_users(users, query)
+
+    paginator = KeysetPaginator(users, 20, ordering=('username',))
+    try:
+        page = paginator.page(after=request.GET.get('after'))
+    except InvalidPage as e:
+        return JsonResponse({'errors': {'after': [str(e)]}}, status=400)
+
+    return JsonResponse({
+        'results': [{'id': user.id, 'username': user.username, 'email': user.email} for user in page],
+        'next': page.next_cursor,
+    })
+
+
 @login_required
 @permission_required('accounts.register_user')
 def signup(request):
@@ -61,10 +147,7 @@ def signup(request):
                 'token': TokenGenerator().make_token(user),
             })
             to_email = form.cleaned_data.get('email')
-            email = EmailMessage(
-                mail_subject, message, to=[to_email]
-            )
-            email.send()
+            enqueue_email(mail_subject, message, to=[to_email])
             messages.success(request, 'Invite sent')
             return HttpResponseRedirect(reverse('accounts:signup'))
     else:
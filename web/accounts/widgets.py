@@ -0,0 +1,24 @@
+from django import forms
+from django.urls import reverse_lazy
+
+
+class UserAutocompleteWidget(forms.SelectMultiple):
+    """
+    Renders only the selected users; further users are looked up through the
+    autocomplete endpoint instead of rendering the whole user table.
+    """
+
+    class Media:
+        js = ('accounts/user_autocomplete.js',)
+
+    def __init__(self, attrs=None):
+        super().__init__({'data-autocomplete-url': reverse_lazy('accounts:autocomplete'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        users = self.choices.queryset.filter(pk__in=selected) if selected else []
+        options = [
+            self.create_option(name, user.pk, str(user), True, index, attrs=attrs)
+            for index, user in enumerate(users)
+        ]
+        return [(None, options, 0)]
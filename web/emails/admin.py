@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import QueuedEmail
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from emails.outbox import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send emails queued in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_mail(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed attempts'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
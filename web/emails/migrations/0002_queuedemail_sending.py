@@ -0,0 +1,26 @@
+# Generated by Django 4.1.5 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='queuedemail',
+            name='queuedemail_pending_idx',
+        ),
+        migrations.AlterField(
+            model_name='queuedemail',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Queued'), (1, 'Sent'), (2, 'Failed'), (3, 'Sending')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='queuedemail',
+            index=models.Index(condition=models.Q(('status__in', [0, 3])), fields=['next_attempt_at', 'id'], name='queuedemail_pending_idx'),
+        ),
+    ]
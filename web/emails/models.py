@@ -0,0 +1,43 @@
+from django.core.mail import EmailMessage
+from django.db import models
+from django.utils import timezone
+
+
+class QueuedEmail(models.Model):
+    QUEUED = 0
+    SENT = 1
+    FAILED = 2
+    SENDING = 3
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+        (SENDING, 'Sending')
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    status = models.IntegerField(default=QUEUED, choices=STATUSES)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # while sending, when the worker's lease ends and another worker may retry the email
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status__in=[0, 3]),
+                name='queuedemail_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
+
+    def as_message(self, connection=None):
+        return EmailMessage(self.subject, self.body, self.from_email or None, self.to, connection=connection)
@@ -0,0 +1,102 @@
+import datetime
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+
+def enqueue_email(subject, body, to, from_email=''):
+    return QueuedEmail.objects.create(subject=subject, body=body, to=list(to), from_email=from_email or '')
+
+
+def enqueue_emails(emails):
+    return QueuedEmail.objects.bulk_create(
+        QueuedEmail(subject=subject, body=body, to=list(to), from_email='') for subject, body, to in emails
+    )
+
+
+def retry_delay(attempts):
+    return datetime.timedelta(
+        seconds=min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+    )
+
+
+def claim_due_emails(batch_size):
+    """
+    Leases due emails to this worker in a short transaction. Rows are picked
+    with SKIP LOCKED and marked as sending until the lease ends, so other
+    workers skip them and retry them only if this worker dies mid-batch.
+    """
+    now = timezone.now()
+    lease = now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status__in=[QueuedEmail.QUEUED, QueuedEmail.SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        QueuedEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            status=QueuedEmail.SENDING, next_attempt_at=lease, attempts=F('attempts') + 1
+        )
+    for email in batch:
+        email.status = QueuedEmail.SENDING
+        email.next_attempt_at = lease
+        email.attempts += 1
+    return batch
+
+
+def _record(email, lease, **fields):
+    # a worker whose lease ran out must not overwrite the result of the worker that took over
+    QueuedEmail.objects.filter(pk=email.pk, status=QueuedEmail.SENDING, next_attempt_at=lease).update(**fields)
+    for name, value in fields.items():
+        setattr(email, name, value)
+
+
+def _deliver(batch, connection):
+    for email in batch:
+        lease = email.next_attempt_at
+        try:
+            connection.open()
+            connection.send_messages([email.as_message(connection)])
+        except Exception as error:
+            last_error = f'{type(error).__name__}: {error}'
+            if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                _record(email, lease, status=QueuedEmail.FAILED, last_error=last_error)
+            else:
+                _record(
+                    email, lease, status=QueuedEmail.QUEUED, last_error=last_error,
+                    next_attempt_at=timezone.now() + retry_delay(email.attempts),
+                )
+            # start over with a fresh connection after a failed delivery
+            connection.close()
+        else:
+            _record(email, lease, status=QueuedEmail.SENT, sent_at=timezone.now(), last_error='')
+
+
+def send_queued_mail(batch_size=100):
+    """
+    Sends due emails in batches over a single reused connection. Each batch is
+    claimed in its own short transaction and every result is saved on its own,
+    so no transaction stays open while talking to the mail server and several
+    workers can drain the outbox concurrently.
+    Returns the number of sent and failed delivery attempts.
+    """
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        while True:
+            batch = claim_due_emails(batch_size)
+            if not batch:
+                break
+            _deliver(batch, connection)
+            batch_sent = sum(email.status == QueuedEmail.SENT for email in batch)
+            sent += batch_sent
+            failed += len(batch) - batch_sent
+    finally:
+        connection.close()
+    return sent, failed
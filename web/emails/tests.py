@@ -0,0 +1,107 @@
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .models import QueuedEmail
+from .outbox import claim_due_emails, enqueue_email, send_queued_mail
+import datetime
+import io
+import smtplib
+
+
+class RecordingEmailBackend(EmailBackend):
+    opened = 0
+    refused = set()
+
+    def open(self):
+        if not getattr(self, 'is_open', False):
+            RecordingEmailBackend.opened += 1
+            self.is_open = True
+        return False
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.refused:
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'refused')})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='emails.tests.RecordingEmailBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=60,
+    EMAIL_OUTBOX_MAX_RETRY_DELAY=3600,
+)
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        RecordingEmailBackend.opened = 0
+        RecordingEmailBackend.refused = set()
+
+    def test_queued_emails_are_sent_in_batches_over_one_connection(self):
+        for i in range(5):
+            enqueue_email(f'subject {i}', 'body', to=[f'user{i}@example-email.com'])
+
+        self.assertEqual(send_queued_mail(batch_size=2), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(RecordingEmailBackend.opened, 1)
+        self.assertFalse(QueuedEmail.objects.exclude(status=QueuedEmail.SENT).exists())
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        RecordingEmailBackend.refused = {'bad@example-email.com'}
+        failing = enqueue_email('subject', 'body', to=['bad@example-email.com'])
+        enqueue_email('subject', 'body', to=['good@example-email.com'])
+
+        self.assertEqual(send_queued_mail(), (1, 1))
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, QueuedEmail.QUEUED)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', failing.last_error)
+        self.assertGreater(failing.next_attempt_at, timezone.now() + datetime.timedelta(seconds=50))
+
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+        QueuedEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        send_queued_mail()
+        failing.refresh_from_db()
+        self.assertGreater(failing.next_attempt_at, timezone.now() + datetime.timedelta(seconds=110))
+
+    def test_email_is_marked_failed_after_max_attempts(self):
+        RecordingEmailBackend.refused = {'bad@example-email.com'}
+        failing = enqueue_email('subject', 'body', to=['bad@example-email.com'])
+        for i in range(3):
+            QueuedEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+            send_queued_mail()
+
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, QueuedEmail.FAILED)
+        self.assertEqual(failing.attempts, 3)
+
+    def test_claimed_emails_are_leased_to_one_worker(self):
+        email = enqueue_email('subject', 'body', to=['user@example-email.com'])
+
+        self.assertEqual(claim_due_emails(10), [email])
+        email.refresh_from_db()
+        self.assertEqual(email.status, QueuedEmail.SENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(claim_due_emails(10), [])
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+        # the worker holding the lease died before recording a result
+        QueuedEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_mail(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.status, QueuedEmail.SENT)
+        self.assertEqual(email.attempts, 2)
+
+    def test_send_queued_mail_command(self):
+        enqueue_email('subject', 'body', to=['user@example-email.com'])
+        out = io.StringIO()
+        call_command('send_queued_mail', stdout=out)
+        self.assertIn('Sent 1 emails, 0 failed attempts', out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['user@example-email.com'])
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    # cache invalidations must reach every worker and pod, which a per-process cache cannot do
+    if settings.CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Error(
+            'REDIS_URL is not set, so every process uses its own local memory cache.',
+            hint='Point REDIS_URL at the Redis service shared by all errander pods.',
+            id='errander.E001',
+        )]
+    return []
@@ -0,0 +1,51 @@
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from errander.db.pool import ConnectionPool, get_pool
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that borrows connections from a per-process pool and
+    returns them on close, so requests skip the TCP and TLS handshake. Configure
+    it with a ``POOL`` dict (MAX_SIZE, TIMEOUT, MAX_LIFETIME, CHECK_AFTER) in the
+    database settings and keep CONN_MAX_AGE at 0.
+    """
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(self.alias, lambda: ConnectionPool(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            check=check_connection,
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 5.0),
+            max_lifetime=options.get('MAX_LIFETIME'),
+            check_after=options.get('CHECK_AFTER', 30.0),
+            alias=self.alias,
+        ))
+
+    def get_new_connection(self, conn_params):
+        return self.get_pool(conn_params).getconn()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        pool = self.get_pool(self.get_connection_params())
+        try:
+            broken = connection.closed or connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+            if not broken and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            if not broken and not connection.autocommit:
+                connection.autocommit = True
+        except Exception:
+            broken = True
+        finally:
+            # the slot must always go back, or the pool runs dry for the life of the worker
+            with self.wrap_database_errors:
+                pool.putconn(connection, discard=broken)
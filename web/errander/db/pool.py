@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+from errander.metrics import DB_POOL_IDLE, DB_POOL_IN_USE, DB_POOL_TIMEOUTS, DB_POOL_WAITS
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of DB-API connections. Checkouts block for up to
+    ``timeout`` seconds when ``max_size`` connections are already in use, and
+    connections idle for longer than ``check_after`` seconds are health checked
+    before being handed out. Pools created with an ``alias`` export their usage
+    as Prometheus metrics labelled with it.
+    """
+
+    def __init__(self, connect, check=None, max_size=10, timeout=5.0, max_lifetime=None, check_after=30.0,
+                 alias=None):
+        self.connect = connect
+        self.alias = alias
+        self.check = check
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._idle = []
+        self._created_at = {}
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.stats = {'connections_created': 0, 'connections_discarded': 0, 'checkouts': 0, 'waits': 0, 'timeouts': 0}
+
+    def _observe(self):
+        # called with the condition held, after every change to the idle list or the in use count
+        if self.alias is not None:
+            DB_POOL_IN_USE.labels(self.alias).set(self._in_use)
+            DB_POOL_IDLE.labels(self.alias).set(len(self._idle))
+
+    def _expired(self, connection):
+        if connection.closed:
+            return True
+        return self.max_lifetime is not None and time.monotonic() - self._created_at[id(connection)] > self.max_lifetime
+
+    def _discard(self, connection):
+        self._created_at.pop(id(connection), None)
+        self.stats['connections_discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _healthy(self, connection, idle_since):
+        if self.check is None or time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            self.check(connection)
+        except Exception:
+            return False
+        return True
+
+    def _reserve(self, deadline):
+        """Returns an idle connection, or None once a slot for a new one is reserved."""
+        with self._condition:
+            while True:
+                while self._idle:
+                    connection, idle_since = self._idle.pop()
+                    if not self._expired(connection):
+                        self._in_use += 1
+                        self._observe()
+                        return connection, idle_since
+                    self._discard(connection)
+                    self._observe()
+
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    self._observe()
+                    return None, None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    if self.alias is not None:
+                        DB_POOL_TIMEOUTS.labels(self.alias).inc()
+                    raise PoolTimeout(f'No database connection available within {self.timeout}s')
+                self.stats['waits'] += 1
+                if self.alias is not None:
+                    DB_POOL_WAITS.labels(self.alias).inc()
+                self._condition.wait(remaining)
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, idle_since = self._reserve(deadline)
+            if connection is None:
+                break
+            if self._healthy(connection, idle_since):
+                with self._condition:
+                    self.stats['checkouts'] += 1
+                return connection
+            self.putconn(connection, discard=True)
+
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._observe()
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created_at[id(connection)] = time.monotonic()
+            self.stats['connections_created'] += 1
+            self.stats['checkouts'] += 1
+        return connection
+
+    def putconn(self, connection, discard=False):
+        with self._condition:
+            self._in_use -= 1
+            if discard or self._expired(connection):
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._observe()
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            self._observe()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                **self.stats,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    # a forked child must not reuse its parent's sockets, so pools are per process
+    key = (alias, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def close_pools():
+    """Closes the idle connections of every pool in this process, e.g. before forking workers."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def pool_stats():
+    pid = os.getpid()
+    return {alias: pool.snapshot() for (alias, pool_pid), pool in list(_pools.items()) if pool_pid == pid}
@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+PRIMARY_COOKIE_NAME = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Sends ORM reads inside the block to a replica, or back to the primary with ``enabled=False``."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+def pinned_to_primary(request):
+    return PRIMARY_COOKIE_NAME in request.COOKIES
+
+
+def _read_from_replica(request):
+    return bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS and not pinned_to_primary(request)
+
+
+def _resolve_user(request):
+    # evaluating the lazy user here reads the session and user from the primary,
+    # so replica lag cannot look like a logout
+    return hasattr(request, 'user') and request.user.is_authenticated
+
+
+def _iterate_with_replica_reads(content):
+    iterator = iter(content)
+    while True:
+        with replica_reads():
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def _stream_from_replica(response):
+    if getattr(response, 'streaming', False) and not getattr(response, 'is_async', False):
+        response.streaming_content = _iterate_with_replica_reads(response.streaming_content)
+    return response
+
+
+def use_replica(view_func):
+    """
+    Serves a read-only view from a read replica. Streaming responses keep
+    reading from the replica while they are iterated. The user is still loaded
+    from the primary, and unsafe methods and sessions that have just written
+    stay on the primary.
+    """
+
+    if asyncio.iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_view(request, *args, **kwargs):
+            if not _read_from_replica(request):
+                return await view_func(request, *args, **kwargs)
+            await sync_to_async(_resolve_user)(request)
+            with replica_reads():
+                return _stream_from_replica(await view_func(request, *args, **kwargs))
+
+        return async_view
+
+    @functools.wraps(view_func)
+    def view(request, *args, **kwargs):
+        if not _read_from_replica(request):
+            return view_func(request, *args, **kwargs)
+        _resolve_user(request)
+        with replica_reads():
+            return _stream_from_replica(view_func(request, *args, **kwargs))
+
+    return view
+
+
+class ReplicaRouter:
+    """
+    Routes reads made under ``replica_reads()`` to a random alias from
+    DATABASE_REPLICAS. Everything else, including all writes and migrations,
+    uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware(MiddlewareMixin):
+    """
+    Pins a session to the primary for REPLICA_STICKY_SECONDS after a request
+    that may have written, so users do not read their own changes from a
+    replica that has not caught up yet.
+    """
+
+    def process_response(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 500:
+            response.set_cookie(
+                PRIMARY_COOKIE_NAME, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
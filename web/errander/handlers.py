@@ -0,0 +1,35 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+_exhausted = object()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django 4.1 iterates streaming responses on the event loop, so exports that
+    read the database lazily fail with SynchronousOnlyOperation once the status
+    is already sent. This handler pulls every chunk in the request's sync thread.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, _exhausted)) is not _exhausted:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
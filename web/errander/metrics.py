@@ -0,0 +1,143 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+REQUESTS = Counter(
+    'errander_requests_total', 'Requests by view, method and status code.',
+    ['view', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'errander_request_duration_seconds', 'Time spent producing a response.',
+    ['view', 'method'],
+)
+RESPONSE_SIZE = Histogram(
+    'errander_response_size_bytes', 'Size of non-streaming response bodies.',
+    ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+DB_QUERIES = Histogram(
+    'errander_request_db_queries', 'SQL queries executed per request.',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+DB_DURATION = Histogram(
+    'errander_request_db_duration_seconds', 'Time spent executing SQL per request.',
+    ['view'],
+)
+# pool gauges are summed over the live worker processes when scraped
+DB_POOL_IN_USE = Gauge(
+    'errander_db_pool_connections_in_use', 'Pooled database connections checked out.',
+    ['alias'], multiprocess_mode='livesum',
+)
+DB_POOL_IDLE = Gauge(
+    'errander_db_pool_connections_idle', 'Pooled database connections waiting to be reused.',
+    ['alias'], multiprocess_mode='livesum',
+)
+DB_POOL_WAITS = Counter(
+    'errander_db_pool_waits', 'Checkouts that had to wait for a pooled connection.',
+    ['alias'],
+)
+DB_POOL_TIMEOUTS = Counter(
+    'errander_db_pool_timeouts', 'Checkouts that gave up waiting for a pooled connection.',
+    ['alias'],
+)
+
+_request_stats = ContextVar('request_db_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.duration += time.perf_counter() - start
+
+
+def instrument(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+def view_label(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match else 'unresolved'
+
+
+def observe(request, response, stats, duration):
+    view = view_label(request)
+    method = request.method if request.method in HTTP_METHODS else 'other'
+    REQUESTS.labels(view, method, response.status_code).inc()
+    REQUEST_LATENCY.labels(view, method).observe(duration)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(view).observe(len(response.content))
+    DB_QUERIES.labels(view).observe(stats.queries)
+    DB_DURATION.labels(view).observe(stats.duration)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, response size, SQL query count and SQL time for every
+    request, labelled with the resolved URL name. Queries are counted by an
+    execute wrapper installed on each database connection, so they are also
+    seen when an async request runs sync code in another thread. Streaming
+    responses are measured up to the first byte only.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        observe(request, response, stats, time.perf_counter() - start)
+        return response
@@ -0,0 +1,161 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import BooleanField, F, Field, Func, Value
+from django.http import Http404
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class RowComparison(Func):
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+    def __init__(self, fields, operator, values):
+        super().__init__(
+            Func(*[F(f) for f in fields], function='ROW', output_field=Field()),
+            Func(*[Value(v) for v in values], function='ROW', output_field=Field()),
+            arg_joiner=f' {operator} ',
+        )
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Keyset page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0])
+
+
+class KeysetPaginator:
+    """
+    Paginates by seeking past the last seen ordering key instead of using OFFSET,
+    so every page costs a single indexed query and no COUNT is ever issued.
+    The ordering must be unique and every field must share the same direction.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('id',)):
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        self.descending = ordering[0].startswith('-')
+        if any(field.startswith('-') != self.descending for field in ordering):
+            raise ValueError('Keyset ordering fields must share the same direction.')
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def _model_field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [str(getattr(obj, self._model_field(name).attname)) for name in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [self._model_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidCursor('Invalid page cursor.')
+
+    def _page_queryset(self, after, before):
+        queryset = self.queryset
+        backwards = bool(before) and not after
+        cursor = after or before
+
+        if cursor:
+            forward_operator = '<' if self.descending else '>'
+            backward_operator = '>' if self.descending else '<'
+            queryset = queryset.filter(RowComparison(
+                self.fields,
+                backward_operator if backwards else forward_operator,
+                self.decode_cursor(cursor),
+            ))
+
+        ordering = self.ordering
+        if backwards:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        return queryset.order_by(*ordering)[:self.per_page + 1], backwards, bool(cursor)
+
+    def _make_page(self, object_list, backwards, has_cursor):
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if backwards:
+            object_list.reverse()
+            return KeysetPage(object_list, self, has_next=True, has_previous=has_more)
+        return KeysetPage(object_list, self, has_next=has_more, has_previous=has_cursor)
+
+    def page(self, after=None, before=None):
+        queryset, backwards, has_cursor = self._page_queryset(after, before)
+        return self._make_page(list(queryset), backwards, has_cursor)
+
+    async def apage(self, after=None, before=None):
+        queryset, backwards, has_cursor = self._page_queryset(after, before)
+        return self._make_page([obj async for obj in queryset], backwards, has_cursor)
+
+
+class KeysetPaginationMixin:
+    paginator_class = KeysetPaginator
+    keyset_ordering = ('id',)
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return self.paginator_class(queryset, per_page, ordering=self.keyset_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_paginator(queryset, page_size)
+        try:
+            page = paginator.page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        context['pagination_query'] = params.urlencode()
+        return context
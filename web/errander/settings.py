@@ -23,6 +23,7 @@ if ENV_ALLOWED_HOSTS:
 INSTALLED_APPS = [
     'accounts',
     'errands',
+    'emails',
     'simple_history',
     'crispy_forms',
     'django.contrib.admin',
@@ -31,11 +32,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'compressor',
     'storages',
 ]
 
 MIDDLEWARE = [
+    'errander.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'errander.db.replicas.PrimaryStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'errander.urls'
@@ -106,6 +110,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+# 0 or 1 hashes passwords one at a time in the request process
+# host CPU counts overstate a pod's CPU limit, so keep the default small
+INVITATION_HASH_WORKERS = int(os.environ.get('INVITATION_HASH_WORKERS', 2))
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 5 * 60))
+
 LOGIN_URL = '/accounts/login_user'
 LOGOUT_URL = '/accounts/logout_user'
 
@@ -117,6 +127,11 @@ EMAIL_HOST = os.environ.get('EMAIL_HOST')
 EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', 60))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_MAX_RETRY_DELAY', 60 * 60))
+# how long a worker may take to send a claimed batch before another worker retries it
+EMAIL_OUTBOX_LEASE = int(os.environ.get('EMAIL_OUTBOX_LEASE', 10 * 60))
 
 DB_IGNORE_SSL = os.environ.get('DB_IGNORE_SSL') == 'True'
 
@@ -136,8 +151,71 @@ if not DB_IGNORE_SSL:
         'sslmode': 'require',
     }
 
+# persistent connections are per thread, which async views do not reuse
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('DB_CONN_MAX_AGE', 0 if os.environ.get('SERVER_MODE') == 'asgi' else 60)
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# pgbouncer in transaction pooling mode cannot keep server-side cursors open across transactions
+if os.environ.get('DB_PGBOUNCER') == 'True':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+if os.environ.get('DB_POOL') == 'True':
+    DATABASES['default'].update({
+        'ENGINE': 'errander.db.backends.pooled',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 30 * 60)),
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', 30)),
+        },
+    })
+
+# comma separated host[:port] list of streaming replicas sharing the primary's credentials
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['errander.db.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
+# bearer token Prometheus must send to scrape /metrics, which is disabled when unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# required in production: cache invalidation has to reach every worker and pod
+# (``manage.py check --deploy`` fails without it); local memory is for development only
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
 
+GEOCODER = {
+    'BACKEND': os.environ.get('GEOCODER_BACKEND', 'errands.geocoding.GoogleGeocoder'),
+}
+GEOCODING_CACHE_TTL_DAYS = int(os.environ.get('GEOCODING_CACHE_TTL_DAYS', 90))
+GEOCODING_FRONT_CACHE_SIZE = int(os.environ.get('GEOCODING_FRONT_CACHE_SIZE', 1024))
+
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles-cdn'
 STATICFILES_DIRS = [
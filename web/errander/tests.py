@@ -0,0 +1,327 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import Permission
+from django.core.checks import run_checks
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from accounts.models import User
+from errands.models import Errand
+from .db.backends.pooled.base import DatabaseWrapper
+from .handlers import StreamingASGIHandler
+from .db.pool import ConnectionPool, PoolTimeout, close_pools, get_pool, pool_stats
+from prometheus_client import REGISTRY
+from .metrics import MetricsMiddleware
+from .db.replicas import (
+    PRIMARY_COOKIE_NAME, PrimaryStickinessMiddleware, ReplicaRouter, replica_reads, replica_reads_enabled, use_replica
+)
+import threading
+import time
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.checks = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(FakeConnection, max_size=2)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.snapshot()['connections_created'], 1)
+        self.assertEqual(pool.snapshot()['in_use'], 1)
+
+    def test_checkout_waits_for_a_free_connection_and_times_out(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.05)
+        first = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        threading.Timer(0.01, pool.putconn, args=(first,)).start()
+        pool.timeout = 1
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.snapshot()['timeouts'], 1)
+
+    def test_closed_expired_and_unhealthy_connections_are_replaced(self):
+        def check(conn):
+            conn.checks += 1
+            if conn.checks > 1:
+                raise OSError('server closed the connection')
+
+        pool = ConnectionPool(FakeConnection, check=check, check_after=0)
+        closed = pool.getconn()
+        closed.closed = 1
+        pool.putconn(closed)
+        unhealthy = pool.getconn()
+        self.assertIsNot(unhealthy, closed)
+
+        pool.putconn(unhealthy)
+        self.assertIs(pool.getconn(), unhealthy)
+        pool.putconn(unhealthy)
+        self.assertIsNot(pool.getconn(), unhealthy)
+
+        pool = ConnectionPool(FakeConnection, max_lifetime=0.01)
+        old = pool.getconn()
+        time.sleep(0.02)
+        pool.putconn(old)
+        self.assertIsNot(pool.getconn(), old)
+
+
+class PooledBackendTest(TestCase):
+
+    def test_pooled_backend_returns_connections_to_the_pool(self):
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': 'errander.db.backends.pooled', 'POOL': {'MAX_SIZE': 2}},
+            alias='default'
+        )
+        wrapper.ensure_connection()
+        self.addCleanup(close_pools)
+        raw_connection = wrapper.connection
+        wrapper.close()
+        self.assertFalse(raw_connection.closed)
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        self.assertIs(wrapper.connection, raw_connection)
+        self.assertEqual(pool_stats()['default']['connections_created'], 1)
+        wrapper.close()
+
+    def test_connection_dropped_mid_transaction_frees_its_slot(self):
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': 'errander.db.backends.pooled', 'POOL': {'MAX_SIZE': 1}},
+            alias='default'
+        )
+        wrapper.ensure_connection()
+        self.addCleanup(close_pools)
+        raw_connection = wrapper.connection
+        raw_connection.autocommit = False
+        with raw_connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            backend_pid = cursor.fetchone()[0]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [backend_pid])
+
+        wrapper.close()
+        self.assertTrue(raw_connection.closed)
+        self.assertEqual(pool_stats()['default']['in_use'], 0)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrapper.close()
+
+    def test_pool_usage_is_exported_as_metrics(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.01, alias='metrics_test')
+        waits = sample('errander_db_pool_waits_total', alias='metrics_test')
+        timeouts = sample('errander_db_pool_timeouts_total', alias='metrics_test')
+
+        first = pool.getconn()
+        self.assertEqual(sample('errander_db_pool_connections_in_use', alias='metrics_test'), 1)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(sample('errander_db_pool_waits_total', alias='metrics_test'), waits + 1)
+        self.assertEqual(sample('errander_db_pool_timeouts_total', alias='metrics_test'), timeouts + 1)
+
+        pool.putconn(first)
+        self.assertEqual(sample('errander_db_pool_connections_in_use', alias='metrics_test'), 0)
+        self.assertEqual(sample('errander_db_pool_connections_idle', alias='metrics_test'), 1)
+        pool.close()
+        self.assertEqual(sample('errander_db_pool_connections_idle', alias='metrics_test'), 0)
+
+    def test_closing_pools_before_forking_closes_their_connections(self):
+        self.addCleanup(close_pools)
+        pool = get_pool('fork_test', lambda: ConnectionPool(FakeConnection))
+        idle = pool.getconn()
+        pool.putconn(idle)
+
+        close_pools()
+        self.assertTrue(idle.closed)
+        self.assertIsNot(get_pool('fork_test', lambda: ConnectionPool(FakeConnection)), pool)
+
+
+def replica_flag_view(request):
+    return HttpResponse(str(replica_reads_enabled()))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_router_only_reads_from_replicas_when_asked(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Errand))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Errand), 'replica_1')
+            self.assertEqual(router.db_for_write(Errand), 'default')
+            with replica_reads(False):
+                self.assertIsNone(router.db_for_read(Errand))
+        self.assertFalse(router.allow_migrate('replica_1', 'errands'))
+        with override_settings(DATABASE_REPLICAS=[]), replica_reads():
+            self.assertIsNone(router.db_for_read(Errand))
+
+    def test_use_replica_only_serves_safe_requests_of_sessions_that_did_not_just_write(self):
+        view = use_replica(replica_flag_view)
+        self.assertEqual(view(self.factory.get('/')).content, b'True')
+        self.assertEqual(view(self.factory.post('/')).content, b'False')
+
+        pinned = self.factory.get('/')
+        pinned.COOKIES[PRIMARY_COOKIE_NAME] = '1'
+        self.assertEqual(view(pinned).content, b'False')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(view(self.factory.get('/')).content, b'False')
+        self.assertFalse(replica_reads_enabled())
+
+    def test_streaming_and_async_views_read_from_replica(self):
+        streaming = use_replica(lambda request: StreamingHttpResponse(str(replica_reads_enabled()) for _ in range(2)))
+        response = streaming(self.factory.get('/'))
+        self.assertFalse(replica_reads_enabled())
+        self.assertEqual(b''.join(response.streaming_content), b'TrueTrue')
+
+        async def async_view(request):
+            return replica_flag_view(request)
+
+        self.assertEqual(async_to_sync(use_replica(async_view))(self.factory.get('/')).content, b'True')
+
+    def test_user_is_loaded_from_the_primary(self):
+        loads = []
+
+        def load_user():
+            loads.append(replica_reads_enabled())
+            return User(username='user')
+
+        request = self.factory.get('/')
+        request.user = SimpleLazyObject(load_user)
+        self.assertEqual(use_replica(replica_flag_view)(request).content, b'True')
+
+        async def async_view(request):
+            return replica_flag_view(request)
+
+        request = self.factory.get('/')
+        request.user = SimpleLazyObject(load_user)
+        async_to_sync(use_replica(async_view))(request)
+        self.assertEqual(loads, [False, False])
+
+    def test_writes_pin_the_session_to_the_primary(self):
+        middleware = PrimaryStickinessMiddleware(lambda request: HttpResponse())
+        self.assertNotIn(PRIMARY_COOKIE_NAME, middleware(self.factory.get('/')).cookies)
+
+        cookie = middleware(self.factory.post('/')).cookies[PRIMARY_COOKIE_NAME]
+        self.assertEqual(cookie['max-age'], 10)
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertNotIn(PRIMARY_COOKIE_NAME, middleware(self.factory.post('/')).cookies)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def query_in_new_thread():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        connection.close()
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='user', email='user@example-email.com', password='verysecret1@')
+        self.client.login(username='user', password='verysecret1@')
+
+    def test_requests_are_recorded_per_view_with_their_queries(self):
+        requests = sample('errander_request_duration_seconds_count', view='errands:index', method='GET')
+        queries = sample('errander_request_db_queries_sum', view='errands:index')
+        responses = sample('errander_requests_total', view='errands:index', method='GET', status='200')
+
+        response = self.client.get(reverse('errands:index'))
+        self.assertEqual(
+            sample('errander_request_duration_seconds_count', view='errands:index', method='GET'), requests + 1
+        )
+        self.assertGreater(sample('errander_request_db_queries_sum', view='errands:index'), queries)
+        self.assertEqual(
+            sample('errander_requests_total', view='errands:index', method='GET', status='200'), responses + 1
+        )
+        self.assertGreaterEqual(sample('errander_response_size_bytes_sum', view='errands:index'), len(response.content))
+
+        metrics = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(metrics.status_code, 200)
+        self.assertContains(metrics, 'errander_request_db_duration_seconds_bucket')
+
+    def test_metrics_require_the_configured_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with self.settings(METRICS_TOKEN=None):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+            self.assertEqual(response.status_code, 403)
+
+    def test_async_requests_count_queries_run_in_other_threads(self):
+        async def get_response(request):
+            await sync_to_async(query_in_new_thread, thread_sensitive=False)()
+            return HttpResponse()
+
+        queries = sample('errander_request_db_queries_sum', view='unresolved')
+        async_to_sync(MetricsMiddleware(get_response))(RequestFactory().get('/'))
+        self.assertEqual(sample('errander_request_db_queries_sum', view='unresolved'), queries + 1)
+
+
+class StreamingASGIHandlerTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='user', email='user@example-email.com', password='verysecret1@')
+        user.user_permissions.add(Permission.objects.get(content_type__app_label='errands', codename='access_history'))
+        self.errand = Errand.objects.create(name='streamed errand', description='errand')
+        self.client.login(username='user', password='verysecret1@')
+        # like the test client, keep the handler from closing the test transaction's connection
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    def asgi_get(self, path):
+        cookies = '; '.join(f'{name}={morsel.value}' for name, morsel in self.client.cookies.items())
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'scheme': 'http',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookies.encode())],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(StreamingASGIHandler())(scope, receive, send)
+        return messages
+
+    def test_streaming_exports_read_the_database_outside_the_event_loop(self):
+        messages = self.asgi_get(reverse('errands:export_history_csv', args=(self.errand.id,)))
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        self.assertIn('streamed errand', body)
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+
+    def deploy_errors(self):
+        return [error.id for error in run_checks(include_deployment_checks=True, tags=['caches'])]
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertIn('errander.E001', self.deploy_errors())
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://redis:6379/0',
+        }}):
+            self.assertNotIn('errander.E001', self.deploy_errors())
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
     path('accounts/', include('accounts.urls')),
     path('errands/', include('errands.urls')),
+    path('metrics', views.metrics, name='metrics'),
 ]
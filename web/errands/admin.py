@@ -1,6 +1,6 @@
 from django.contrib import admin
 from simple_history.admin import SimpleHistoryAdmin
-from .models import Errand
+from .models import Errand, GeocodedAddress
 from .forms import CreateErrandForm
 from simple_history.utils import update_change_reason
 
@@ -22,4 +22,10 @@ class ErrandAdmin(SimpleHistoryAdmin):
             update_change_reason(errand, "delete")
 
 
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ['address', 'latitude', 'longitude', 'provider', 'geocoded_at']
+    search_fields = ['address_key']
+
+
 admin.site.register(Errand, ErrandAdmin)
+admin.site.register(GeocodedAddress, GeocodedAddressAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ErrandsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'errands'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from errander import checks  # noqa: F401
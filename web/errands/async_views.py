@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from errander.db.replicas import use_replica
+from errander.pagination import KeysetPaginator
+
+from .exports import history_record, with_assigned_usernames
+from .forms import ErrandFilterForm
+from .models import Errand
+
+
+def _load_user(request):
+    # reuses the user use_replica already loaded from the primary
+    user = request.user if hasattr(request, 'user') else get_user(request)
+    if user.is_authenticated:
+        # fills the per-request permission cache so later has_perm calls stay off the database
+        user.get_all_permissions()
+    return user
+
+
+async def authenticated_user(request):
+    request.user = await sync_to_async(_load_user)(request)
+    return request.user if request.user.is_authenticated else None
+
+
+def errand_json(errand):
+    return {
+        'id': errand.id,
+        'name': errand.name,
+        'description': errand.description,
+        'status': errand.status,
+        'address': errand.address,
+        'latitude': errand.latitude,
+        'longitude': errand.longitude,
+        'url': reverse('errands:detail', args=[errand.id]),
+    }
+
+
+def page_json(page, results):
+    return JsonResponse({
+        'results': results,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }, encoder=DjangoJSONEncoder)
+
+
+async def keyset_page(request, queryset, per_page, ordering):
+    paginator = KeysetPaginator(queryset, per_page, ordering=ordering)
+    try:
+        return await paginator.apage(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidPage as e:
+        raise Http404(str(e))
+
+
+@use_replica
+async def errand_list(request):
+    user = await authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    queryset = Errand.objects.visible_to(user)
+    filter_form = ErrandFilterForm(request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse({'errors': filter_form.errors}, status=400)
+    if filter_form.cleaned_data['q']:
+        queryset = queryset.search(filter_form.cleaned_data['q'])
+    if filter_form.cleaned_data['status']:
+        queryset = queryset.filter(status__in=filter_form.cleaned_data['status'])
+    if filter_form.cleaned_data['assignee']:
+        queryset = queryset.filter(assigned_users=filter_form.cleaned_data['assignee'])
+
+    page = await keyset_page(request, queryset.defer('search_vector'), 25, ('status', 'id'))
+    return page_json(page, [errand_json(errand) for errand in page])
+
+
+async def _visible_errand(user, pk):
+    try:
+        return await Errand.objects.visible_to(user).defer('search_vector').aget(pk=pk)
+    except Errand.DoesNotExist:
+        raise Http404('No errand found matching the query')
+
+
+@use_replica
+async def errand_detail(request, pk):
+    user = await authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    errand = await _visible_errand(user, pk)
+    data = errand_json(errand)
+    data['assigned_users'] = [
+        assigned async for assigned in errand.assigned_users.order_by('username').values('id', 'username')
+    ]
+    last_change = await errand.history.afirst()
+    data['last_change'] = last_change and {
+        'date': last_change.history_date,
+        'reason': last_change.history_change_reason,
+    }
+    return JsonResponse(data, encoder=DjangoJSONEncoder)
+
+
+@use_replica
+async def errand_history(request, pk):
+    user = await authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    if not user.has_perm('errands.access_history'):
+        raise PermissionDenied
+
+    errand = await _visible_errand(user, pk)
+    history = with_assigned_usernames(errand.history.select_related('history_user'))
+    page = await keyset_page(request, history, 50, ('-history_id',))
+    return page_json(page, [history_record(record) for record in page])
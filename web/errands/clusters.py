@@ -0,0 +1,109 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, FloatField, Min, Q, Value
+from django.db.models.functions import Floor
+
+GENERATION_CACHE_KEY = 'errands:map:generation'
+TILE_CACHE_TIMEOUT = 300
+GRID_SIZE = 8
+MAX_ZOOM = 20
+MAX_TILES = 64
+
+
+def map_generation():
+    return cache.get_or_set(GENERATION_CACHE_KEY, time.time_ns, None)
+
+
+def invalidate_map_clusters(**kwargs):
+    cache.set(GENERATION_CACHE_KEY, time.time_ns(), None)
+
+
+def tile_size(zoom):
+    return 360.0 / 2 ** zoom, 180.0 / 2 ** zoom
+
+
+def tiles_for_bounds(south, west, north, east, zoom):
+    width, height = tile_size(zoom)
+    columns = 2 ** zoom
+    first_row = int((south + 90) // height)
+    last_row = min(int((north + 90) // height), columns - 1)
+    first_column = int((west + 180) // width)
+    last_column = min(int((east + 180) // width), columns - 1)
+    if west > east:
+        column_range = list(range(first_column, columns)) + list(range(0, last_column + 1))
+    else:
+        column_range = list(range(first_column, last_column + 1))
+    return [(x, y) for y in range(first_row, last_row + 1) for x in column_range]
+
+
+def column_spans(columns):
+    spans = []
+    for column in sorted(columns):
+        if spans and spans[-1][1] == column - 1:
+            spans[-1][1] = column
+        else:
+            spans.append([column, column])
+    return spans
+
+
+def compute_tile_clusters(queryset, zoom, tiles):
+    """
+    Clusters every tile in ``tiles`` with one GROUP BY over the global grid of
+    cells at ``zoom``, then splits the cells back into their tiles.
+    """
+    width, height = tile_size(zoom)
+    cell_width, cell_height = width / GRID_SIZE, height / GRID_SIZE
+    rows = [y for x, y in tiles]
+
+    columns = Q()
+    for first, last in column_spans({x for x, y in tiles}):
+        columns |= Q(longitude__gte=first * width - 180, longitude__lt=(last + 1) * width - 180)
+
+    cells = (
+        queryset
+        .filter(columns, latitude__gte=min(rows) * height - 90, latitude__lt=(max(rows) + 1) * height - 90)
+        .annotate(
+            cell_x=Floor((F('longitude') + Value(180.0, output_field=FloatField())) / cell_width),
+            cell_y=Floor((F('latitude') + Value(90.0, output_field=FloatField())) / cell_height),
+        )
+        .values('cell_x', 'cell_y')
+        .annotate(count=Count('id'), latitude=Avg('latitude'), longitude=Avg('longitude'), errand_id=Min('id'))
+        .order_by()
+    )
+    clusters = {tile: [] for tile in tiles}
+    for cell in cells:
+        tile = (int(cell['cell_x']) // GRID_SIZE, int(cell['cell_y']) // GRID_SIZE)
+        if tile in clusters:
+            clusters[tile].append({
+                'latitude': cell['latitude'],
+                'longitude': cell['longitude'],
+                'count': cell['count'],
+                'errand_id': cell['errand_id'] if cell['count'] == 1 else None,
+            })
+    return clusters
+
+
+def clusters_for_bounds(queryset, scope, south, west, north, east, zoom):
+    zoom = max(0, min(zoom, MAX_ZOOM))
+    tiles = tiles_for_bounds(south, west, north, east, zoom)
+    while len(tiles) > MAX_TILES and zoom > 0:
+        zoom -= 1
+        tiles = tiles_for_bounds(south, west, north, east, zoom)
+
+    generation = map_generation()
+    keys = {f'errands:map:{scope}:{generation}:{zoom}:{x}:{y}': (x, y) for x, y in tiles}
+    cached = cache.get_many(keys.keys())
+
+    missing = {}
+    missing_tiles = [tile for key, tile in keys.items() if key not in cached]
+    if missing_tiles:
+        computed = compute_tile_clusters(queryset, zoom, missing_tiles)
+        missing = {key: computed[tile] for key, tile in keys.items() if key not in cached}
+        cache.set_many(missing, TILE_CACHE_TIMEOUT)
+
+    clusters = []
+    for key in keys:
+        clusters.extend(cached.get(key, missing.get(key, [])))
+    return zoom, clusters
+
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.db.models import Max
+from errander.db.replicas import replica_reads
+
+from .models import Errand
+
+DETAIL_CACHE_TIMEOUT = 60 * 60
+
+
+def detail_cache_key(errand_id, history_id):
+    return f'errands:detail:{errand_id}:{history_id}'
+
+
+def history_fragment_cache_key(errand_id, history_id, cursor):
+    return f'errands:history:{errand_id}:{history_id}:{cursor}'
+
+
+def latest_history_ids(*errand_ids):
+    # always read from the primary, it decides whether a cached entry may be served
+    with replica_reads(False):
+        return dict(
+            Errand.history.filter(id__in=errand_ids)
+            .order_by().values('id').annotate(history_id=Max('history_id')).values_list('id', 'history_id')
+        )
+
+
+def invalidate_errand_detail(*errand_ids):
+    """Drops cached entries that were filled before a change that kept the errand's history_id."""
+    cache.delete_many([
+        detail_cache_key(errand_id, history_id) for errand_id, history_id in latest_history_ids(*errand_ids).items()
+    ])
+
+
+def errand_detail(errand_id):
+    """
+    Returns the errand, its latest history record and assigned user ids. The
+    errand's latest history_id is read from the primary on every call and is
+    part of the cache key, so a change made through any process is seen at once.
+    """
+    history_id = latest_history_ids(errand_id).get(errand_id)
+    key = detail_cache_key(errand_id, history_id)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    # the entry outlives the request, so it is never filled from a replica that may lag behind
+    with replica_reads(False):
+        errand = Errand.objects.filter(pk=errand_id).prefetch_related('assigned_users').first()
+        if errand is None:
+            return None
+        last_change = errand.history.select_related('history_user').order_by('-history_id').first()
+    entry = {
+        'errand': errand,
+        'last_change': last_change,
+        'history_id': last_change.history_id if last_change else None,
+        'assigned_user_ids': [user.id for user in errand.assigned_users.all()],
+    }
+    cache.set(detail_cache_key(errand_id, entry['history_id']), entry, DETAIL_CACHE_TIMEOUT)
+    return entry
+
+
+def can_view_errand(user, entry):
+    return user.has_perm('errands.can_list_and_view_every_errand') or user.id in entry['assigned_user_ids']
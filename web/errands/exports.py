@@ -0,0 +1,197 @@
+import csv
+import datetime
+import importlib.util
+import io
+import json
+
+from django.apps import apps
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+HISTORY_FIELD_NAMES = [
+    'id', 'name', 'description', 'status', 'assigned_users',
+    'change_date', 'change_reason', 'change_type', 'user_committing_change'
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+ARROW_FORMATS = ('parquet', 'arrow')
+
+
+def arrow_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def with_assigned_usernames(history_queryset):
+    HistoricalErrandAssignedUsers = apps.get_model('errands', 'historicalerrand_assigned_users')
+
+    return history_queryset.annotate(
+        assigned_users_list=Subquery(
+            HistoricalErrandAssignedUsers.objects
+            .filter(history_id=OuterRef('history_id'))
+            .values('history_id')
+            .annotate(usernames=ArrayAgg('user__username', distinct=True))
+            .values('usernames')
+        )
+    )
+
+
+def filter_history(history_queryset, date_from=None, date_to=None, statuses=None, assignee=None):
+    if date_from:
+        history_queryset = history_queryset.filter(history_date__gte=_start_of_day(date_from))
+    if date_to:
+        history_queryset = history_queryset.filter(
+            history_date__lt=_start_of_day(date_to + datetime.timedelta(days=1))
+        )
+    if statuses:
+        history_queryset = history_queryset.filter(status__in=statuses)
+    if assignee:
+        history_queryset = history_queryset.filter(historicalerrand_assigned_users__user_id=assignee)
+    return history_queryset
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def history_record(history):
+    return {
+        'id': history.id,
+        'name': history.name,
+        'description': history.description,
+        'status': history.status,
+        'assigned_users': history.assigned_users_list,
+        'change_date': history.history_date,
+        'change_reason': history.history_change_reason,
+        'change_type': history.history_type,
+        'user_committing_change': history.history_user.username if history.history_user else None,
+    }
+
+
+def history_records(history_queryset, chunk_size=2000):
+    history_queryset = with_assigned_usernames(history_queryset.select_related('history_user'))
+
+    for history in history_queryset.iterator(chunk_size=chunk_size):
+        yield history_record(history)
+
+
+def history_rows(history_queryset, chunk_size=2000):
+    for record in history_records(history_queryset, chunk_size=chunk_size):
+        yield [record[field_name] for field_name in HISTORY_FIELD_NAMES]
+
+
+def stream_csv(header, rows, rows_per_chunk=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def stream_ndjson(records, rows_per_chunk=500):
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, cls=DjangoJSONEncoder))
+        if len(lines) == rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _history_arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('description', pa.string()),
+        ('status', pa.int64()),
+        ('assigned_users', pa.list_(pa.string())),
+        ('change_date', pa.timestamp('us', tz='UTC')),
+        ('change_reason', pa.string()),
+        ('change_type', pa.string()),
+        ('user_committing_change', pa.string()),
+    ])
+
+
+def stream_arrow(records, export_format, rows_per_batch=10000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _history_arrow_schema()
+    sink = _ChunkSink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    yield sink.drain()
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == rows_per_batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    writer.close()
+    yield sink.drain()
+
+
+def stream_history(history_queryset, export_format, chunk_size=2000):
+    if export_format == 'csv':
+        return stream_csv(HISTORY_FIELD_NAMES, history_rows(history_queryset, chunk_size=chunk_size))
+
+    records = history_records(history_queryset, chunk_size=chunk_size)
+    if export_format == 'ndjson':
+        return stream_ndjson(records)
+    if export_format in ARROW_FORMATS:
+        return stream_arrow(records, export_format)
+    raise ValueError(f'Unsupported export format: {export_format}')
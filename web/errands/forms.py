@@ -1,6 +1,10 @@
 from django import forms
 from .models import Errand
+from .exports import ARROW_FORMATS, EXPORT_FORMATS, arrow_available
+from .geo import parse_geolocation
+from .geocoding import get_geocoding_service
 from accounts.models import User
+from accounts.widgets import UserAutocompleteWidget
 from permissionedforms import PermissionedForm
 
 
@@ -9,7 +13,7 @@ class CreateErrandForm(forms.ModelForm):
         model = Errand
         exclude = ['status']
         widgets = {
-            'assigned_users': forms.CheckboxSelectMultiple,
+            'assigned_users': UserAutocompleteWidget,
         }
 
     def __init__(self, *args, **kwargs):
@@ -17,13 +21,20 @@ class CreateErrandForm(forms.ModelForm):
         self.fields['address'].widget.attrs['id'] = 'autocomplete'
         self.fields['address'].widget.attrs['name'] = 'autocomplete'
 
+    def save(self, commit=True):
+        errand = super(CreateErrandForm, self).save(commit)
+        point = parse_geolocation(errand.geolocation)
+        if point is not None:
+            get_geocoding_service().remember(errand.address, point, provider='client')
+        return errand
+
 
 class DetailEditForm(PermissionedForm):
     status = forms.IntegerField(label="Errand status", widget=forms.Select(choices=Errand.STATUSES))
     change_reason = forms.CharField(label="Note", max_length=100)
     assigned_users = forms.ModelMultipleChoiceField(
         queryset=User.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
+        widget=UserAutocompleteWidget,
         required=False,
         label='Assign users'
     )
@@ -34,3 +45,59 @@ class DetailEditForm(PermissionedForm):
             'assigned_users': 'errands.assign_users'
         }
 
+
+class ErrandFilterForm(forms.Form):
+    q = forms.CharField(max_length=100, required=False, label='Search')
+    status = forms.TypedMultipleChoiceField(
+        choices=Errand.STATUSES,
+        coerce=int,
+        widget=forms.CheckboxSelectMultiple,
+        required=False,
+        label='Status'
+    )
+    assignee = forms.IntegerField(min_value=1, required=False, label='Assigned user id')
+
+
+class HistoryExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[(name, name) for name in EXPORT_FORMATS], required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    status = forms.TypedMultipleChoiceField(choices=Errand.STATUSES, coerce=int, required=False)
+    assignee = forms.IntegerField(min_value=1, required=False)
+
+    def clean_format(self):
+        export_format = self.cleaned_data['format'] or 'csv'
+        if export_format in ARROW_FORMATS and not arrow_available():
+            raise forms.ValidationError('Export format %(format)s requires pyarrow to be installed.',
+                                        params={'format': export_format})
+        return export_format
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('Start date must not be after end date.')
+        return cleaned_data
+
+
+class NearbyErrandsForm(forms.Form):
+    lat = forms.FloatField(min_value=-90, max_value=90)
+    lng = forms.FloatField(min_value=-180, max_value=180)
+    radius = forms.FloatField(min_value=0.01, max_value=100, required=False)
+
+    def clean_radius(self):
+        return self.cleaned_data['radius'] or 5
+
+
+class BoundingBoxForm(forms.Form):
+    south = forms.FloatField(min_value=-90, max_value=90)
+    west = forms.FloatField(min_value=-180, max_value=180)
+    north = forms.FloatField(min_value=-90, max_value=90)
+    east = forms.FloatField(min_value=-180, max_value=180)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('south') is not None and cleaned_data.get('north') is not None \
+                and cleaned_data['south'] > cleaned_data['north']:
+            raise forms.ValidationError('South edge must not be north of the north edge.')
+        return cleaned_data
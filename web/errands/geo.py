@@ -0,0 +1,51 @@
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def parse_geolocation(geolocation):
+    try:
+        latitude, longitude = (float(part) for part in geolocation.split('|'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = (
+        math.sin((latitude2 - latitude1) / 2) ** 2 +
+        math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_expression(latitude, longitude, latitude_field='latitude', longitude_field='longitude'):
+    latitude_delta = Radians(F(latitude_field)) - Value(math.radians(latitude), output_field=FloatField())
+    longitude_delta = Radians(F(longitude_field)) - Value(math.radians(longitude), output_field=FloatField())
+    a = (
+        Power(Sin(latitude_delta / 2), 2) +
+        Value(math.cos(math.radians(latitude)), output_field=FloatField()) *
+        Cos(Radians(F(latitude_field))) * Power(Sin(longitude_delta / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    latitude_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - latitude_delta, -90.0), min(latitude + latitude_delta, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+
+    longitude_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if longitude_delta >= 180:
+        return south, -180.0, north, 180.0
+    west = (longitude - longitude_delta + 180) % 360 - 180
+    east = (longitude + longitude_delta + 180) % 360 - 180
+    return south, west, north, east
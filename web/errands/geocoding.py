@@ -0,0 +1,162 @@
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import GeocodedAddress
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_address(address):
+    return re.sub(r'[\s,.;]+', ' ', address.casefold()).strip()
+
+
+class GoogleGeocoder:
+    name = 'google'
+    endpoint = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+    def __init__(self, api_key=None, timeout=5):
+        self.api_key = api_key or settings.GOOGLE_API_KEY
+        self.timeout = timeout
+
+    def geocode(self, address):
+        query = urllib.parse.urlencode({'address': address, 'key': self.api_key})
+        try:
+            # URLError, HTTPError and timeouts are all OSErrors, bad JSON is a ValueError
+            with urllib.request.urlopen(f'{self.endpoint}?{query}', timeout=self.timeout) as response:
+                payload = json.load(response)
+            if payload.get('status') != 'OK' or not payload.get('results'):
+                return None
+            location = payload['results'][0]['geometry']['location']
+            return location['lat'], location['lng']
+        except (OSError, ValueError, LookupError, TypeError, AttributeError):
+            logger.warning('Geocoding %r failed', address, exc_info=True)
+            return None
+
+
+class StaticGeocoder:
+    name = 'static'
+
+    def __init__(self, locations=None):
+        self.locations = {normalize_address(address): tuple(point) for address, point in (locations or {}).items()}
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        return self.locations.get(normalize_address(address))
+
+
+class GeocodingService:
+    def __init__(self, provider, ttl=datetime.timedelta(days=90), front_cache_size=1024, front_cache_ttl=3600):
+        self.provider = provider
+        self.ttl = ttl
+        self.front_cache_size = front_cache_size
+        self.front_cache_ttl = front_cache_ttl
+        self._front_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _front_get(self, key):
+        with self._lock:
+            entry = self._front_cache.get(key)
+            if entry is None:
+                return None
+            point, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._front_cache[key]
+                return None
+            self._front_cache.move_to_end(key)
+            return point
+
+    def _front_set(self, key, point):
+        with self._lock:
+            self._front_cache[key] = (point, time.monotonic() + self.front_cache_ttl)
+            self._front_cache.move_to_end(key)
+            while len(self._front_cache) > self.front_cache_size:
+                self._front_cache.popitem(last=False)
+
+    def remember(self, address, point, provider=None):
+        key = normalize_address(address)
+        if not key:
+            return
+        GeocodedAddress.objects.update_or_create(
+            address_key=key,
+            defaults={
+                'address': address[:200],
+                'latitude': point[0],
+                'longitude': point[1],
+                'provider': provider or self.provider.name,
+                'geocoded_at': timezone.now(),
+            },
+        )
+        self._front_set(key, tuple(point))
+
+    def geocode(self, address):
+        return self.geocode_many([address]).get(address)
+
+    def geocode_many(self, addresses):
+        results = {}
+        pending = {}
+        for address in addresses:
+            key = normalize_address(address)
+            if not key:
+                continue
+            point = self._front_get(key)
+            if point is not None:
+                results[address] = point
+            else:
+                pending.setdefault(key, []).append(address)
+
+        if pending:
+            stored = GeocodedAddress.objects.filter(
+                address_key__in=pending.keys(),
+                geocoded_at__gte=timezone.now() - self.ttl,
+            )
+            for geocoded in stored:
+                point = (geocoded.latitude, geocoded.longitude)
+                self._front_set(geocoded.address_key, point)
+                for address in pending.pop(geocoded.address_key):
+                    results[address] = point
+
+        for key, same_addresses in pending.items():
+            point = self.provider.geocode(same_addresses[0])
+            if point is None:
+                continue
+            self.remember(same_addresses[0], point)
+            for address in same_addresses:
+                results[address] = tuple(point)
+        return results
+
+
+_service = None
+
+
+def get_geocoding_service():
+    global _service
+    if _service is None:
+        provider_settings = settings.GEOCODER
+        provider = import_string(provider_settings['BACKEND'])(**provider_settings.get('OPTIONS', {}))
+        _service = GeocodingService(
+            provider,
+            ttl=datetime.timedelta(days=settings.GEOCODING_CACHE_TTL_DAYS),
+            front_cache_size=settings.GEOCODING_FRONT_CACHE_SIZE,
+        )
+    return _service
+
+
+@receiver(setting_changed)
+def reset_geocoding_service(setting, **kwargs):
+    global _service
+    if setting in ('GEOCODER', 'GEOCODING_CACHE_TTL_DAYS', 'GEOCODING_FRONT_CACHE_SIZE'):
+        _service = None
@@ -0,0 +1,45 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from errands.exports import ARROW_FORMATS, EXPORT_FORMATS, arrow_available, filter_history, stream_history
+from errands.models import Errand
+
+
+class Command(BaseCommand):
+    help = 'Export the history of errands matching the given filters as CSV, NDJSON, Parquet or Arrow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat,
+                            help='First day of history to export (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat,
+                            help='Last day of history to export (YYYY-MM-DD)')
+        parser.add_argument('--status', type=int, action='append', choices=[s for s, _ in Errand.STATUSES])
+        parser.add_argument('--assignee', type=int, help='Id of assigned user')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--output', '-o', help='Output file, defaults to stdout')
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        if export_format in ARROW_FORMATS and not arrow_available():
+            raise CommandError(f'Export format {export_format} requires pyarrow to be installed.')
+
+        history = filter_history(
+            Errand.history.all(),
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            statuses=options['status'],
+            assignee=options['assignee'],
+        ).order_by('history_id')
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in stream_history(history, export_format, chunk_size=options['chunk_size']):
+                output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from simple_history.utils import bulk_update_with_history
+
+from errands.clusters import invalidate_map_clusters
+from errands.geocoding import get_geocoding_service
+from errands.models import Errand
+
+
+class Command(BaseCommand):
+    help = 'Geocode addresses of errands imported without geolocation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        service = get_geocoding_service()
+        geocoded = failed = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                Errand.objects
+                .filter(id__gt=last_id, geolocation='')
+                .exclude(address='')
+                .order_by('id')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            points = service.geocode_many([errand.address for errand in batch])
+            updated = []
+            for errand in batch:
+                point = points.get(errand.address)
+                if point is None:
+                    failed += 1
+                    self.stderr.write(f'Could not geocode errand {errand.id}: {errand.address}')
+                    continue
+                errand.geolocation = f'{point[0]}|{point[1]}'
+                errand.latitude, errand.longitude = point
+                updated.append(errand)
+
+            geocoded += len(updated)
+            if updated and not options['dry_run']:
+                bulk_update_with_history(
+                    updated, Errand, ['geolocation', 'latitude', 'longitude'], default_change_reason='geocoded'
+                )
+
+        if geocoded and not options['dry_run']:
+            invalidate_map_clusters()
+        self.stdout.write(self.style.SUCCESS(f'Geocoded {geocoded} errands, {failed} failed'))
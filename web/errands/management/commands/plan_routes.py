@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from errands.models import Errand
+from errands.routing import plan_route
+
+
+class Command(BaseCommand):
+    help = 'Plan and cache routes for every user with active errands assigned'
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(
+            errand__status__in=Errand.ACTIVE_STATUSES,
+            errand__latitude__isnull=False,
+        ).distinct()
+
+        started = time.monotonic()
+        planned = 0
+        for user in users.iterator():
+            stops, total_km = plan_route(user)
+            planned += 1
+            self.stdout.write(f'{user.username}: {len(stops)} stops, {total_km:.1f} km')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Planned {planned} routes in {time.monotonic() - started:.2f}s'
+        ))
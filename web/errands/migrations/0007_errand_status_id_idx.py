@@ -0,0 +1,17 @@
+# Generated by Django 4.1.5 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errands', '0006_alter_errand_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='errand',
+            index=models.Index(fields=['status', 'id'], name='errand_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errands', '0007_errand_status_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS errands_errand_assigned_users_user_errand_idx '
+                'ON errands_errand_assigned_users (user_id, errand_id);',
+            reverse_sql='DROP INDEX IF EXISTS errands_errand_assigned_users_user_errand_idx;',
+        ),
+        migrations.AddIndex(
+            model_name='errand',
+            index=models.Index(condition=models.Q(('status__in', [1, 2, 3])), fields=['status', 'id'], name='errand_active_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.5 on 2026-10-18 12:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+SEARCH_VECTOR_TRIGGER = '''
+CREATE OR REPLACE FUNCTION errands_errand_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.address, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER errands_errand_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, description, address ON errands_errand
+FOR EACH ROW EXECUTE FUNCTION errands_errand_search_vector_update();
+
+UPDATE errands_errand SET name = name;
+'''
+
+DROP_SEARCH_VECTOR_TRIGGER = '''
+DROP TRIGGER IF EXISTS errands_errand_search_vector_trigger ON errands_errand;
+DROP FUNCTION IF EXISTS errands_errand_search_vector_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errands', '0008_errand_filter_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='errand',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(sql=SEARCH_VECTOR_TRIGGER, reverse_sql=DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.AddIndex(
+            model_name='errand',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='errand_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errand',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['address'], name='errand_address_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
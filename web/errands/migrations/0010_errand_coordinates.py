@@ -0,0 +1,27 @@
+# Generated by Django 4.1.5 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errands', '0009_errand_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='errand',
+            name='latitude',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='errand',
+            name='longitude',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='errand',
+            index=models.Index(fields=['latitude', 'longitude'], name='errand_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, transaction
+
+from errands.geo import parse_geolocation
+
+BATCH_SIZE = 1000
+
+
+def backfill_coordinates(apps, schema_editor):
+    Errand = apps.get_model('errands', 'Errand')
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Errand.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'geolocation')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            for errand in batch:
+                errand.latitude, errand.longitude = parse_geolocation(errand.geolocation) or (None, None)
+            Errand.objects.bulk_update(batch, ['latitude', 'longitude'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('errands', '0010_errand_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_coordinates, migrations.RunPython.noop),
+    ]
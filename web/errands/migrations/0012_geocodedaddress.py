@@ -0,0 +1,26 @@
+# Generated by Django 4.1.5 on 2026-10-18 13:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errands', '0011_backfill_errand_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_key', models.CharField(max_length=200, unique=True)),
+                ('address', models.CharField(max_length=200)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('provider', models.CharField(max_length=50)),
+                ('geocoded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,7 +1,43 @@
 from django.db import models
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVectorField
 from accounts.models import User
 from simple_history.models import HistoricalRecords
 
+from .geo import bounding_box, haversine_expression, parse_geolocation
+
+
+SEARCH_CONFIG = 'simple'
+
+
+class ErrandQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        if user.has_perm('errands.can_list_and_view_every_errand'):
+            return self.all()
+
+        return self.filter(assigned_users__in=[user.id])
+
+    def search(self, query):
+        return self.filter(
+            models.Q(search_vector=SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')) |
+            models.Q(address__trigram_similar=query)
+        )
+
+    def within(self, south, west, north, east):
+        queryset = self.filter(latitude__range=(south, north))
+        if west > east:
+            return queryset.filter(models.Q(longitude__gte=west) | models.Q(longitude__lte=east))
+        return queryset.filter(longitude__range=(west, east))
+
+    def nearby(self, latitude, longitude, radius_km):
+        return (
+            self.within(*bounding_box(latitude, longitude, radius_km))
+            .annotate(distance=haversine_expression(latitude, longitude))
+            .filter(distance__lte=radius_km)
+            .order_by('distance')
+        )
+
 
 class Errand(models.Model):
     STATUSES = (
@@ -11,6 +47,7 @@ class Errand(models.Model):
         (3, 'In progress'),
         (4, 'Done')
     )
+    ACTIVE_STATUSES = (1, 2, 3)
 
     assigned_users = models.ManyToManyField(User, blank=True)
     name = models.CharField(max_length=50, null=False)
@@ -18,11 +55,29 @@ class Errand(models.Model):
     status = models.IntegerField(default=1, choices=STATUSES, null=False)
     address = models.CharField(max_length=200, null=False)
     geolocation = models.CharField(max_length=200, null=False)
+    latitude = models.FloatField(null=True, editable=False)
+    longitude = models.FloatField(null=True, editable=False)
+    # maintained by the errands_errand_search_vector_update database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
     history = HistoricalRecords(
         m2m_fields=[assigned_users],
+        excluded_fields=['search_vector', 'latitude', 'longitude'],
     )
 
+    objects = ErrandQuerySet.as_manager()
+
     class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='errand_status_id_idx'),
+            models.Index(
+                fields=['status', 'id'],
+                name='errand_active_status_id_idx',
+                condition=models.Q(status__in=[1, 2, 3]),
+            ),
+            GinIndex(fields=['search_vector'], name='errand_search_vector_idx'),
+            GinIndex(fields=['address'], name='errand_address_trgm_idx', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['latitude', 'longitude'], name='errand_lat_lng_idx'),
+        ]
         permissions = [
             ('create', 'User can create Errand object'),
             ('assign_users', 'User can add/remove users to Errand object'),
@@ -32,3 +87,19 @@ class Errand(models.Model):
 
     def __str__(self):
         return f'Name: {self.name}\nDesc: {self.description}'
+
+    def save(self, *args, **kwargs):
+        self.latitude, self.longitude = parse_geolocation(self.geolocation) or (None, None)
+        super().save(*args, **kwargs)
+
+
+class GeocodedAddress(models.Model):
+    address_key = models.CharField(max_length=200, unique=True)
+    address = models.CharField(max_length=200)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    provider = models.CharField(max_length=50)
+    geocoded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.address}: {self.latitude}|{self.longitude}'
@@ -0,0 +1,135 @@
+import time
+
+from django.core.cache import cache
+
+from .geo import haversine_km
+from .models import Errand
+
+ROUTE_CACHE_TIMEOUT = 60 * 60 * 24
+TWO_OPT_TIME_BUDGET = 0.5
+
+
+class DistanceMatrix:
+    def __init__(self):
+        self.points = {}
+        self.distances = {}
+
+    @staticmethod
+    def _key(a, b):
+        return (a, b) if a < b else (b, a)
+
+    def sync(self, points):
+        changed = 0
+        for removed in set(self.points) - set(points):
+            del self.points[removed]
+            for other in self.points:
+                self.distances.pop(self._key(removed, other), None)
+            changed += 1
+
+        for point_id, coordinates in points.items():
+            if self.points.get(point_id) == coordinates:
+                continue
+            self.points[point_id] = coordinates
+            for other_id, other_coordinates in self.points.items():
+                if other_id != point_id:
+                    self.distances[self._key(point_id, other_id)] = haversine_km(*coordinates, *other_coordinates)
+            changed += 1
+        return changed
+
+    def distance(self, a, b):
+        return 0.0 if a == b else self.distances[self._key(a, b)]
+
+
+def nearest_neighbour(matrix, start=None):
+    size = len(matrix)
+    unvisited = set(range(size))
+    if start is None:
+        current = 0
+    else:
+        current = min(unvisited, key=lambda j: start[j])
+    route = [current]
+    unvisited.remove(current)
+
+    while unvisited:
+        row = matrix[current]
+        current = min(unvisited, key=row.__getitem__)
+        route.append(current)
+        unvisited.remove(current)
+    return route
+
+
+def two_opt(route, matrix, start=None, time_budget=TWO_OPT_TIME_BUDGET):
+    deadline = time.monotonic() + time_budget
+    size = len(route)
+    if start is None:
+        start = [0.0] * len(matrix)
+    improved = True
+
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(size - 1):
+            a = route[i - 1] if i > 0 else None
+            b = route[i]
+            for k in range(i + 1, size):
+                c = route[k]
+                d = route[k + 1] if k + 1 < size else None
+                before = (start[b] if a is None else matrix[a][b]) + (matrix[c][d] if d is not None else 0)
+                after = (start[c] if a is None else matrix[a][c]) + (matrix[b][d] if d is not None else 0)
+                if after < before - 1e-9:
+                    route[i:k + 1] = reversed(route[i:k + 1])
+                    b = route[i]
+                    improved = True
+    return route
+
+
+def solve_route(point_ids, distances, origin_distances=None):
+    if len(point_ids) < 2:
+        return list(point_ids)
+
+    matrix = [[distances.distance(a, b) for b in point_ids] for a in point_ids]
+    start = None
+    if origin_distances is not None:
+        start = [origin_distances[point_id] for point_id in point_ids]
+
+    route = two_opt(nearest_neighbour(matrix, start), matrix, start)
+    return [point_ids[i] for i in route]
+
+
+def route_cache_key(user_id):
+    return f'errands:routes:{user_id}'
+
+
+def plan_route(user, origin=None):
+    errands = {
+        errand.id: errand
+        for errand in Errand.objects
+        .filter(assigned_users=user, status__in=Errand.ACTIVE_STATUSES, latitude__isnull=False)
+        .only('id', 'name', 'address', 'status', 'latitude', 'longitude')
+    }
+    points = {errand_id: (errand.latitude, errand.longitude) for errand_id, errand in errands.items()}
+
+    cached = cache.get(route_cache_key(user.id)) or {'matrix': DistanceMatrix(), 'route': None}
+    if cached['matrix'].sync(points):
+        cached['route'] = None
+
+    if origin is None and cached['route'] is not None:
+        route = cached['route']
+    else:
+        origin_distances = None
+        if origin is not None:
+            origin_distances = {point_id: haversine_km(*origin, *point) for point_id, point in points.items()}
+        route = solve_route(sorted(points), cached['matrix'], origin_distances)
+        if origin is None:
+            cached['route'] = route
+    cache.set(route_cache_key(user.id), cached, ROUTE_CACHE_TIMEOUT)
+
+    stops = []
+    previous = origin
+    total_km = 0.0
+    for errand_id in route:
+        errand = errands[errand_id]
+        leg_km = haversine_km(*previous, *points[errand_id]) if previous is not None else 0.0
+        total_km += leg_km
+        stops.append({'errand': errand, 'leg_km': leg_km})
+        previous = points[errand_id]
+    return stops, total_km
@@ -0,0 +1,18 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .clusters import invalidate_map_clusters
+from .detail_cache import invalidate_errand_detail
+from .models import Errand
+
+
+@receiver(post_save, sender=Errand)
+@receiver(post_delete, sender=Errand)
+@receiver(m2m_changed, sender=Errand.assigned_users.through)
+def errand_changed(sender, instance, **kwargs):
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    invalidate_map_clusters()
+    # changes made from the errand side add a history record, which already moves the detail cache key
+    if kwargs.get('reverse'):
+        invalidate_errand_detail(*(kwargs['pk_set'] or instance.errand_set.values_list('id', flat=True)))
@@ -0,0 +1,61 @@
+$.getScript( "https://maps.googleapis.com/maps/api/js?key=" + google_api_key)
+.done(function( script, textStatus ) {
+    google.maps.event.addDomListener(window, "load", initClusterMap)
+})
+
+var clusterMarkers = [];
+var clusterRequest = 0;
+
+function initClusterMap() {
+    var map = new google.maps.Map(document.getElementById("map"), {
+        zoom: 6,
+        center: new google.maps.LatLng(52.0, 19.0),
+    });
+    map.addListener('idle', function () {
+        loadClusters(map);
+    });
+}
+
+function loadClusters(map) {
+    var bounds = map.getBounds();
+    if (!bounds) {
+        return;
+    }
+    var params = $.param({
+        south: bounds.getSouthWest().lat(),
+        west: bounds.getSouthWest().lng(),
+        north: bounds.getNorthEast().lat(),
+        east: bounds.getNorthEast().lng(),
+        zoom: map.getZoom(),
+    });
+    var request = ++clusterRequest;
+
+    fetch(clusters_url + '?' + params, {credentials: 'same-origin'})
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+            if (request !== clusterRequest) {
+                return;
+            }
+            clusterMarkers.forEach(function (marker) { marker.setMap(null); });
+            clusterMarkers = data.clusters.map(function (cluster) {
+                return drawCluster(map, cluster);
+            });
+        });
+}
+
+function drawCluster(map, cluster) {
+    var marker = new google.maps.Marker({
+        position: new google.maps.LatLng(cluster.latitude, cluster.longitude),
+        label: cluster.count > 1 ? String(cluster.count) : null,
+        map: map,
+    });
+    marker.addListener('click', function () {
+        if (cluster.url) {
+            window.location = cluster.url;
+        } else {
+            map.setCenter(marker.getPosition());
+            map.setZoom(map.getZoom() + 2);
+        }
+    });
+    return marker;
+}
@@ -6,6 +6,21 @@ $.getScript( "https://maps.googleapis.com/maps/api/js?key=" + google_api_key + "
 $(document).ready(function () {
     $("#latitudeArea").addClass("d-none");
     $("#longtitudeArea").addClass("d-none");
+
+    $('#autocomplete').on('change', function () {
+        var address = $(this).val();
+        if (address === '' || $('#id_geolocation').val() !== '') {
+            return;
+        }
+        fetch(geocode_url + '?' + $.param({address: address}), {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                if (data.result && $('#id_geolocation').val() === '') {
+                    document.getElementById("id_geolocation").value = data.result.latitude + '|' + data.result.longitude;
+                    initMap(data.result.latitude, data.result.longitude, address);
+                }
+            });
+    });
 });
 
 
@@ -1,9 +1,34 @@
+var historyNextUrl = null;
+var historyLoaded = false;
+
+function loadHistoryPage(url) {
+  fetch(url, {credentials: 'same-origin'})
+    .then(function (response) { return response.text(); })
+    .then(function (html) {
+      var rows = $('#historyRows');
+      rows.append(html);
+      var nextRow = rows.find('tr[data-next-url]');
+      historyNextUrl = nextRow.data('next-url') || null;
+      nextRow.remove();
+      $('#historyMoreBtn').toggleClass('d-none', historyNextUrl === null);
+    });
+}
+
 $(document).ready(function(){
   $('#mapDisplayBtn').click(function(){
     if ($('#displayTable').is(':hidden')){
         $('#displayTable').css('display', 'block');
+        if (!historyLoaded) {
+            historyLoaded = true;
+            loadHistoryPage($('#historyRows').data('history-url'));
+        }
     } else {
         $('#displayTable').css('display', 'none');
     }
   });
-});
\ No newline at end of file
+  $('#historyMoreBtn').click(function(){
+    if (historyNextUrl !== null) {
+        loadHistoryPage(historyNextUrl);
+    }
+  });
+});
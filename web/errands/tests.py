@@ -1,12 +1,34 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from accounts.models import User
 from errands.models import Errand
 from django.urls import reverse
 from .forms import DetailEditForm, CreateErrandForm
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .exports import arrow_available
+from .geo import bounding_box, haversine_km, parse_geolocation
+from .routing import DistanceMatrix, solve_route
+from .geocoding import GoogleGeocoder, get_geocoding_service, reset_geocoding_service
+from .models import GeocodedAddress
+from .detail_cache import detail_cache_key, errand_detail, invalidate_errand_detail
+from django.core.cache import cache
+from simple_history.utils import update_change_reason
+from errander.db.replicas import replica_reads
+from django.test import override_settings
+import random
+import time
 import csv
+import datetime
 import io
+import json
+import os
+import tempfile
+import unittest
+import urllib.error
+from unittest import mock
 
 
 def create_user(username, email, password):
@@ -16,8 +38,10 @@ def create_user(username, email, password):
     return user
 
 
-def create_errand(name, description, status=1):
-    return Errand.objects.create(name=name, description=description, status=status)
+def create_errand(name, description, status=1, address='', geolocation=''):
+    return Errand.objects.create(
+        name=name, description=description, status=status, address=address, geolocation=geolocation
+    )
 
 
 def assign_users_to_errands(errands, assigned_users):
@@ -104,6 +128,26 @@ class ErrandIndexTest(TestCase):
             ]
         )
 
+    @override_settings(REDIS_URL='redis://redis:6379/0')
+    def test_index_answers_conditional_requests(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        etag = self.client.get(reverse('errands:index'))['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('errands:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        assign_perm_to_user(Errand, self.user1_with_errands, 'can_list_and_view_every_errand')
+        response = self.client.get(reverse('errands:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.errands_with_assigned_user1[0].assigned_users.remove(self.user2_with_errands)
+        response = self.client.get(reverse('errands:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
     def test_user_can_list_assigned_errands(self):
         self.client.login(
             username=user1_with_errands_data['username'],
@@ -137,7 +181,7 @@ class ErrandIndexTest(TestCase):
         )
         response = self.client.get(reverse('errands:index'), follow=True)
         self.assertNotContains(response, new_errand.name)
-        self.assertNotEqual(response.context['errands'].count(), Errand.objects.all().count())
+        self.assertNotEqual(len(response.context['errands']), Errand.objects.all().count())
 
     def test_user_with_proper_permission_can_view_all_errands(self):
         new_errand = create_errand('another', 'errand')
@@ -147,7 +191,7 @@ class ErrandIndexTest(TestCase):
         )
         response = self.client.get(reverse('errands:index'), follow=True)
         self.assertContains(response, new_errand.name)
-        self.assertEqual(response.context['errands'].count(), Errand.objects.all().count())
+        self.assertEqual(len(response.context['errands']), Errand.objects.all().count())
 
     def test_not_logged_in_users_cant_access_errands_index(self):
         response = self.client.get(reverse('errands:index'), follow=True)
@@ -164,6 +208,371 @@ class ErrandIndexTest(TestCase):
         self.assertQuerysetEqual(response.context['errands'], [])
         self.assertContains(response, 'No errands assigned.')
 
+    def test_index_is_paginated_with_stable_cursors(self):
+        for i in range(30):
+            create_errand(f'paginated {i}', 'errand')
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        first_page = self.client.get(reverse('errands:index'))
+        first_ids = [e.id for e in first_page.context['errands']]
+        self.assertEqual(len(first_ids), 25)
+        self.assertFalse(first_page.context['page_obj'].has_previous())
+        self.assertTrue(first_page.context['page_obj'].has_next())
+
+        second_page = self.client.get(
+            reverse('errands:index'), {'after': first_page.context['page_obj'].next_cursor}
+        )
+        second_ids = [e.id for e in second_page.context['errands']]
+        self.assertEqual(len(second_ids), Errand.objects.count() - 25)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertFalse(second_page.context['page_obj'].has_next())
+
+        previous_page = self.client.get(
+            reverse('errands:index'), {'before': second_page.context['page_obj'].previous_cursor}
+        )
+        self.assertEqual([e.id for e in previous_page.context['errands']], first_ids)
+
+    def test_index_page_is_ordered_by_status_and_id(self):
+        create_errand('done errand', 'errand', status=4)
+        create_errand('discarded errand', 'errand', status=0)
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:index'))
+        keys = [(e.status, e.id) for e in response.context['errands']]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_index_can_be_filtered_by_status(self):
+        done_errand = create_errand('done errand', 'errand', status=4)
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:index'), {'status': [1, 2, 3]})
+        self.assertNotIn(done_errand, response.context['errands'])
+        self.assertEqual(len(response.context['errands']), Errand.objects.filter(status__in=[1, 2, 3]).count())
+
+        response = self.client.get(reverse('errands:index'), {'status': 4})
+        self.assertEqual(list(response.context['errands']), [done_errand])
+
+    def test_index_can_be_filtered_by_assignee(self):
+        create_errand('unassigned errand', 'errand')
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:index'), {'assignee': self.user1_with_errands.id})
+        self.assertEqual(list(response.context['errands']), self.errands_with_assigned_user1)
+
+    def test_assignee_filter_does_not_widen_visibility(self):
+        other_errand = create_errand('other errand', 'errand')
+        other_errand.assigned_users.add(self.user_without_errands)
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:index'), {'assignee': self.user_without_errands.id})
+        self.assertQuerysetEqual(response.context['errands'], [])
+
+    def test_index_returns_404_for_malformed_cursor(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:index'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ErrandSearchTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.user_with_permission_to_view_and_list_all_errands = create_user(
+            username=user3['username'],
+            email=user3['email'],
+            password=user3['password']
+        )
+        assign_perm_to_user(
+            Errand,
+            self.user_with_permission_to_view_and_list_all_errands,
+            'can_list_and_view_every_errand'
+        )
+
+        self.parcel_errand = create_errand(
+            'Deliver parcel', 'Fragile package for reception', address='Marszalkowska 10, Warszawa'
+        )
+        self.plumbing_errand = create_errand(
+            'Fix sink', 'Leaking kitchen sink', address='Dluga 5, Krakow'
+        )
+        assign_users_to_errands([self.parcel_errand], [self.user1_with_errands])
+
+    def test_index_search_matches_name_and_description(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:index'), {'q': 'parcel'})
+        self.assertEqual(list(response.context['errands']), [self.parcel_errand])
+
+        response = self.client.get(reverse('errands:index'), {'q': 'kitchen'})
+        self.assertEqual(list(response.context['errands']), [self.plumbing_errand])
+
+    def test_search_tolerates_typos_in_address(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:search'), {'q': 'Marszalkowka 10 Warszawa'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.parcel_errand.id])
+
+    def test_search_respects_errand_visibility(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:search'), {'q': 'sink'})
+        self.assertEqual(response.json()['results'], [])
+
+        response = self.client.get(reverse('errands:search'), {'q': 'parcel'})
+        self.assertEqual(response.json()['results'], [{
+            'id': self.parcel_errand.id,
+            'name': self.parcel_errand.name,
+            'address': self.parcel_errand.address,
+            'status': self.parcel_errand.status,
+            'url': reverse('errands:detail', args=[self.parcel_errand.id]),
+        }])
+
+    def test_anonymous_users_cant_search_errands(self):
+        response = self.client.get(reverse('errands:search'), {'q': 'parcel'}, follow=True)
+        self.assertTemplateUsed(response, 'accounts/login.html')
+
+
+class GeoTest(SimpleTestCase):
+
+    def test_geolocation_is_parsed_into_coordinates(self):
+        self.assertEqual(parse_geolocation('52.2319|21.0067'), (52.2319, 21.0067))
+
+    def test_malformed_geolocation_is_not_parsed(self):
+        for geolocation in ['', '12,124|13.125', '52.2319', '91|0', '0|181', None]:
+            self.assertIsNone(parse_geolocation(geolocation))
+
+    def test_haversine_distance(self):
+        self.assertAlmostEqual(haversine_km(52.2319, 21.0067, 50.0647, 19.9450), 252.0, delta=1.0)
+
+    def test_bounding_box_wraps_antimeridian(self):
+        south, west, north, east = bounding_box(0, 179.99, 10)
+        self.assertGreater(west, east)
+
+
+class ErrandLocationTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.palace = create_errand('palace', 'errand', geolocation='52.2319|21.0067')
+        self.old_town = create_errand('old town', 'errand', geolocation='52.2497|21.0122')
+        self.krakow = create_errand('krakow', 'errand', geolocation='50.0647|19.9450')
+        self.unknown = create_errand('unknown', 'errand', geolocation='somewhere')
+        assign_users_to_errands([self.palace, self.old_town, self.krakow, self.unknown], [self.user1_with_errands])
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+
+    def test_coordinates_are_stored_on_save(self):
+        self.assertEqual((self.palace.latitude, self.palace.longitude), (52.2319, 21.0067))
+        self.assertIsNone(self.unknown.latitude)
+
+        self.palace.geolocation = '52.0|21.0'
+        self.palace.save()
+        self.palace.refresh_from_db()
+        self.assertEqual((self.palace.latitude, self.palace.longitude), (52.0, 21.0))
+
+    def test_nearby_errands_are_ordered_by_distance(self):
+        response = self.client.get(reverse('errands:nearby'), {'lat': 52.2330, 'lng': 21.0070, 'radius': 10})
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], [self.palace.id, self.old_town.id])
+        self.assertLess(results[0]['distance_km'], results[1]['distance_km'])
+
+    def test_errands_within_bounding_box(self):
+        response = self.client.get(reverse('errands:within'), {'south': 49, 'west': 19, 'north': 51, 'east': 20})
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.krakow.id])
+
+    def test_location_queries_respect_errand_visibility(self):
+        hidden = create_errand('hidden', 'errand', geolocation='52.2320|21.0068')
+        response = self.client.get(reverse('errands:nearby'), {'lat': 52.2319, 'lng': 21.0067})
+        self.assertNotIn(hidden.id, [r['id'] for r in response.json()['results']])
+
+    def test_invalid_location_queries_are_rejected(self):
+        response = self.client.get(reverse('errands:nearby'), {'lat': 100, 'lng': 21})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('errands:within'), {'south': 51, 'west': 19, 'north': 49, 'east': 20})
+        self.assertEqual(response.status_code, 400)
+
+
+class ErrandMapTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.dispatcher = create_user(
+            username=user3['username'],
+            email=user3['email'],
+            password=user3['password']
+        )
+        assign_perm_to_user(Errand, self.dispatcher, 'can_list_and_view_every_errand')
+
+        self.warsaw_errands = [
+            create_errand('palace', 'errand', geolocation='52.2319|21.0067'),
+            create_errand('old town', 'errand', geolocation='52.2497|21.0122'),
+        ]
+        self.krakow = create_errand('krakow', 'errand', geolocation='50.0647|19.9450')
+        assign_users_to_errands([self.krakow], [self.user1_with_errands])
+
+        self.world = {'south': -85, 'west': -180, 'north': 85, 'east': 179.9}
+
+    def test_clusters_are_aggregated_per_grid_cell(self):
+        self.client.login(username=user3['username'], password=user3['password'])
+
+        response = self.client.get(reverse('errands:map_clusters'), dict(self.world, zoom=0))
+        self.assertEqual([c['count'] for c in response.json()['clusters']], [3])
+
+        response = self.client.get(
+            reverse('errands:map_clusters'), {'south': 49, 'west': 18, 'north': 53, 'east': 22, 'zoom': 8}
+        )
+        clusters = sorted(response.json()['clusters'], key=lambda c: c['latitude'])
+        self.assertEqual([c['count'] for c in clusters], [1, 2])
+        self.assertEqual(clusters[0]['url'], reverse('errands:detail', args=[self.krakow.id]))
+
+    def test_cluster_tiles_are_cached_until_errands_change(self):
+        self.client.login(username=user3['username'], password=user3['password'])
+        url = reverse('errands:map_clusters')
+
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url, dict(self.world, zoom=0))
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url, dict(self.world, zoom=0))
+        self.assertLess(len(warm), len(cold))
+
+        create_errand('gdansk', 'errand', geolocation='54.3520|18.6466')
+        response = self.client.get(url, dict(self.world, zoom=0))
+        self.assertEqual(sum(c['count'] for c in response.json()['clusters']), 4)
+
+    def test_missing_cluster_tiles_are_computed_in_one_query(self):
+        self.client.login(username=user3['username'], password=user3['password'])
+        url = reverse('errands:map_clusters')
+        self.client.get(url, {'south': 52, 'west': 20.5, 'north': 52.5, 'east': 21.5, 'zoom': 8})
+
+        with CaptureQueriesContext(connection) as cold:
+            response = self.client.get(url, {'south': 49, 'west': 18, 'north': 53, 'east': 22, 'zoom': 8})
+        self.assertEqual(len([q for q in cold.captured_queries if 'GROUP BY' in q['sql']]), 1)
+        clusters = sorted(response.json()['clusters'], key=lambda c: c['latitude'])
+        self.assertEqual([c['count'] for c in clusters], [1, 2])
+
+    def test_clusters_respect_errand_visibility(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:map_clusters'), dict(self.world, zoom=0))
+        self.assertEqual([c['count'] for c in response.json()['clusters']], [1])
+
+    def test_invalid_cluster_queries_are_rejected(self):
+        self.client.login(username=user3['username'], password=user3['password'])
+        response = self.client.get(reverse('errands:map_clusters'), dict(self.world, zoom='far'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_map_page_is_rendered(self):
+        self.client.login(username=user3['username'], password=user3['password'])
+        response = self.client.get(reverse('errands:map'))
+        self.assertContains(response, reverse('errands:map_clusters'))
+
+
+class RoutingTest(SimpleTestCase):
+
+    def test_distance_matrix_is_updated_incrementally(self):
+        matrix = DistanceMatrix()
+        self.assertEqual(matrix.sync({1: (52.0, 21.0), 2: (52.1, 21.0), 3: (50.0, 20.0)}), 3)
+        self.assertEqual(matrix.sync({1: (52.0, 21.0), 2: (52.1, 21.0), 3: (50.0, 20.0)}), 0)
+
+        self.assertEqual(matrix.sync({1: (52.0, 21.0), 2: (52.2, 21.0), 4: (51.0, 20.0)}), 3)
+        self.assertAlmostEqual(matrix.distance(1, 2), haversine_km(52.0, 21.0, 52.2, 21.0))
+        self.assertEqual(len(matrix.distances), 3)
+
+    def test_route_visits_points_along_a_line_in_order(self):
+        points = {i: (52.0, 20.0 + 0.1 * i) for i in range(10)}
+        shuffled = list(points)
+        random.Random(1).shuffle(shuffled)
+        matrix = DistanceMatrix()
+        matrix.sync({i: points[i] for i in shuffled})
+
+        route = solve_route(shuffled, matrix)
+        self.assertIn(route, [list(range(10)), list(reversed(range(10)))])
+
+        origin_distances = {i: haversine_km(52.0, 21.0, *points[i]) for i in points}
+        self.assertEqual(solve_route(shuffled, matrix, origin_distances), list(reversed(range(10))))
+
+    def test_two_hundred_stops_are_planned_well_under_a_second(self):
+        generator = random.Random(2)
+        points = {i: (52 + generator.random(), 20 + generator.random()) for i in range(200)}
+        matrix = DistanceMatrix()
+        started = time.monotonic()
+        matrix.sync(points)
+        route = solve_route(sorted(points), matrix)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(sorted(route), sorted(points))
+
+
+class RoutePlanTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.stops = [
+            create_errand('west', 'errand', geolocation='52.0|20.0'),
+            create_errand('east', 'errand', geolocation='52.0|20.2'),
+            create_errand('middle', 'errand', geolocation='52.0|20.1'),
+        ]
+        done = create_errand('done', 'errand', status=4, geolocation='52.0|20.05')
+        assign_users_to_errands(self.stops + [done], [self.user1_with_errands])
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+
+    def test_route_orders_active_errands(self):
+        response = self.client.get(reverse('errands:route'), {'lat': 52.0, 'lng': 19.9})
+        self.assertEqual([stop['errand'].name for stop in response.context['stops']], ['west', 'middle', 'east'])
+        self.assertAlmostEqual(response.context['total_km'], haversine_km(52.0, 19.9, 52.0, 20.2), places=3)
+
+    def test_route_is_replanned_when_errand_moves(self):
+        self.client.get(reverse('errands:route'))
+        self.stops[0].geolocation = '52.0|20.3'
+        self.stops[0].save()
+        response = self.client.get(reverse('errands:route'), {'lat': 52.0, 'lng': 19.9})
+        self.assertEqual([stop['errand'].name for stop in response.context['stops']], ['middle', 'east', 'west'])
+
+    def test_plan_routes_command_plans_every_user(self):
+        out = io.StringIO()
+        call_command('plan_routes', stdout=out)
+        self.assertIn(f'{self.user1_with_errands.username}: 3 stops', out.getvalue())
+
 
 class ErrandDetailTest(TestCase):
 
@@ -236,6 +645,278 @@ class ErrandDetailTest(TestCase):
 
         self.assertEqual(response.context['errand'].name, user_errand.name)
 
+    def test_repeat_detail_views_are_served_from_cache(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        self.client.get(reverse('errands:detail', args=(errand.id,)))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        self.assertEqual(response.status_code, 200)
+        errand_queries = [query['sql'] for query in queries if 'errands_' in query['sql']]
+        self.assertEqual(len(errand_queries), 1)
+        self.assertIn('MAX', errand_queries[0])
+
+    def test_stale_cached_detail_is_not_served(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        stale = errand_detail(errand.id)
+
+        errand.assigned_users.remove(self.user1_with_errands)
+        # another process that missed the change puts its copy back
+        cache.set(detail_cache_key(errand.id, stale['history_id']), stale)
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_errand_changes_invalidate_cached_detail(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        self.client.get(reverse('errands:detail', args=(errand.id,)))
+
+        errand.description = 'changed description'
+        errand.save()
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        self.assertContains(response, 'changed description')
+
+        errand.assigned_users.remove(self.user1_with_errands)
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_cached_detail_is_never_filled_from_a_replica(self):
+        errand = self.errands_with_assigned_user1[0]
+        # 'replica_1' is not configured, so any read routed to it would fail
+        with replica_reads():
+            detail = errand_detail(errand.id)
+            self.assertTrue(self.user_with_permission_to_view_and_list_all_errands.has_perm(
+                'errands.can_list_and_view_every_errand'
+            ))
+        self.assertEqual(detail['assigned_user_ids'], [self.user1_with_errands.id])
+
+    def test_detail_answers_conditional_requests(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        errand.status = 4
+        errand.save()
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_logging_in_again_renders_a_page_with_the_new_csrf_token(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        etag = self.client.get(reverse('errands:detail', args=(errand.id,)))['ETag']
+
+        self.client.logout()
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_detail_does_not_leak_to_other_users(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        etag = self.client.get(reverse('errands:detail', args=(errand.id,)))['ETag']
+
+        self.client.login(
+            username=user_without_errands_data['username'],
+            password=user_without_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_history_fragment_is_cached_until_next_change(self):
+        assign_perm_to_user(Errand, self.user1_with_errands, 'access_history')
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        self.client.get(reverse('errands:history', args=(errand.id,)))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('errands:history', args=(errand.id,)))
+        errand_queries = [query['sql'] for query in queries if 'errands_' in query['sql']]
+        self.assertEqual(len(errand_queries), 1)
+        self.assertIn('MAX', errand_queries[0])
+
+        errand.status = 4
+        errand.save()
+        response = self.client.get(reverse('errands:history', args=(errand.id,)))
+        self.assertContains(response, '<td>Done</td>')
+
+
+@override_settings(GEOCODER={
+    'BACKEND': 'errands.geocoding.StaticGeocoder',
+    'OPTIONS': {'locations': {'Main Street 1, Warsaw': (52.2, 21.0)}},
+})
+class GeocodingTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        reset_geocoding_service('GEOCODER')
+        self.service = get_geocoding_service()
+
+    def test_repeated_and_equivalent_addresses_hit_provider_once(self):
+        results = self.service.geocode_many(['Main Street 1, Warsaw', 'main street 1 warsaw', 'Nowhere'])
+        self.assertEqual(results['Main Street 1, Warsaw'], (52.2, 21.0))
+        self.assertEqual(results['main street 1 warsaw'], (52.2, 21.0))
+        self.assertNotIn('Nowhere', results)
+        self.assertEqual(self.service.provider.calls, 2)
+        self.assertEqual(self.service.geocode('MAIN STREET 1, WARSAW'), (52.2, 21.0))
+        self.assertEqual(self.service.provider.calls, 2)
+
+    def test_stored_results_survive_front_cache_and_expire(self):
+        self.service.geocode('Main Street 1, Warsaw')
+        self.service._front_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.service.geocode('Main Street 1, Warsaw'), (52.2, 21.0))
+        self.assertEqual(self.service.provider.calls, 1)
+
+        self.service._front_cache.clear()
+        GeocodedAddress.objects.update(geocoded_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        self.service.geocode('Main Street 1, Warsaw')
+        self.assertEqual(self.service.provider.calls, 2)
+
+    def test_google_geocoder_outages_are_treated_as_no_result(self):
+        geocoder = GoogleGeocoder(api_key='key')
+        with mock.patch('urllib.request.urlopen', side_effect=urllib.error.URLError('down')), \
+                self.assertLogs('errands.geocoding', 'WARNING'):
+            self.assertIsNone(geocoder.geocode('Main Street 1'))
+        with mock.patch('urllib.request.urlopen', return_value=io.BytesIO(b'<html>')), \
+                self.assertLogs('errands.geocoding', 'WARNING'):
+            self.assertIsNone(geocoder.geocode('Main Street 1'))
+
+    def test_creating_errand_remembers_client_coordinates(self):
+        assign_perm_to_user(Errand, self.user1_with_errands, 'create')
+        form = CreateErrandForm(data={
+            'name': 'n', 'description': 'd', 'address': 'Client Street 5', 'geolocation': '50.0|19.0',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(GeocodedAddress.objects.get().provider, 'client')
+        self.assertEqual(self.service.geocode('client street 5'), (50.0, 19.0))
+        self.assertEqual(self.service.provider.calls, 0)
+
+    def test_geocode_view_requires_permission(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:geocode'), {'address': 'Main Street 1, Warsaw'})
+        self.assertEqual(response.status_code, 403)
+
+        assign_perm_to_user(Errand, self.user1_with_errands, 'create')
+        response = self.client.get(reverse('errands:geocode'), {'address': 'Main Street 1, Warsaw'})
+        self.assertEqual(response.json(), {'result': {'latitude': 52.2, 'longitude': 21.0}})
+
+    def test_geocode_errands_command_fills_missing_coordinates(self):
+        imported = [
+            create_errand('first', 'errand', address='Main Street 1, Warsaw'),
+            create_errand('second', 'errand', address='main street 1 warsaw'),
+            create_errand('unknown', 'errand', address='Nowhere'),
+        ]
+        out = io.StringIO()
+        call_command('geocode_errands', stdout=out, stderr=io.StringIO())
+        self.assertIn('Geocoded 2 errands, 1 failed', out.getvalue())
+        self.assertEqual(self.service.provider.calls, 2)
+
+        imported[0].refresh_from_db()
+        self.assertEqual((imported[0].latitude, imported[0].longitude), (52.2, 21.0))
+        self.assertEqual(imported[0].geolocation, '52.2|21.0')
+        self.assertEqual(imported[0].history.first().history_change_reason, 'geocoded')
+
+
+class AsyncErrandApiTest(TestCase):
+
+    def setUp(self):
+        self.user1_with_errands = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.user_without_errands = create_user(
+            username=user_without_errands_data['username'],
+            email=user_without_errands_data['email'],
+            password=user_without_errands_data['password']
+        )
+        self.errands = [create_errand(f'errand {i}', 'errand', status=1 + i % 2) for i in range(30)]
+        assign_users_to_errands(self.errands, [self.user1_with_errands])
+        create_errand('someone else', 'errand')
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+
+    def test_anonymous_users_are_redirected_to_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('errands:api_list'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_list_is_keyset_paginated_and_filtered(self):
+        first_page = self.client.get(reverse('errands:api_list')).json()
+        self.assertEqual(len(first_page['results']), 25)
+        second_page = self.client.get(reverse('errands:api_list'), {'after': first_page['next']}).json()
+        self.assertEqual(len(second_page['results']), 5)
+        self.assertIsNone(second_page['next'])
+        self.assertNotIn('someone else', [errand['name'] for errand in first_page['results'] + second_page['results']])
+
+        response = self.client.get(reverse('errands:api_list'), {'status': 2})
+        self.assertEqual({errand['status'] for errand in response.json()['results']}, {2})
+
+    def test_detail_respects_visibility(self):
+        errand = self.errands[0]
+        data = self.client.get(reverse('errands:api_detail', args=(errand.id,))).json()
+        self.assertEqual(data['name'], errand.name)
+        self.assertEqual(data['assigned_users'], [{'id': self.user1_with_errands.id, 'username': self.user1_with_errands.username}])
+
+        self.client.login(
+            username=user_without_errands_data['username'],
+            password=user_without_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:api_detail', args=(errand.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_history_requires_permission(self):
+        errand = self.errands[0]
+        response = self.client.get(reverse('errands:api_history', args=(errand.id,)))
+        self.assertEqual(response.status_code, 403)
+
+        assign_perm_to_user(Errand, self.user1_with_errands, 'access_history')
+        errand.status = 4
+        errand.save()
+        results = self.client.get(reverse('errands:api_history', args=(errand.id,))).json()['results']
+        self.assertEqual(results[0]['status'], 4)
+        self.assertEqual(results[0]['assigned_users'], [self.user1_with_errands.username])
+
 
 class ErrandCreateTest(TestCase):
 
@@ -383,6 +1064,26 @@ class ErrandEditTest(TestCase):
         self.assertEqual(user_errand.status, 2)
         self.assertEqual(user_errand.history.first().history_change_reason, 'test change reason')
 
+    def test_cached_detail_includes_change_reason_of_update(self):
+        self.client.login(
+            username=user2_with_errands_data['username'],
+            password=user2_with_errands_data['password']
+        )
+        user_errand = Errand.objects.filter(assigned_users=self.user2_with_errands.id).first()
+
+        def read_between_writes(errand, reason):
+            # a detail page requested while the update is still running
+            errand_detail(errand.id)
+            update_change_reason(errand, reason)
+
+        with mock.patch('errands.views.update_change_reason', read_between_writes), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('errands:update', args=(user_errand.id,)),
+                {'status': 2, 'change_reason': 'test change reason'},
+            )
+        self.assertEqual(errand_detail(user_errand.id)['last_change'].history_change_reason, 'test change reason')
+
     def test_every_assigned_user_can_see_changes_to_errand(self):
         user1_errand = Errand.objects.filter(assigned_users=self.user1_with_errands.id).first()
 
@@ -407,7 +1108,7 @@ class ErrandEditTest(TestCase):
         response = self.client.get(reverse('errands:detail', args=(user1_errand.id,)), follow=True)
         self.assertContains(response, 'change by user 1')
 
-    def test_users_with_correct_permission_can_view_assign_users_checkboxes_in_edit_view(self):
+    def test_users_with_correct_permission_can_view_assigned_users_picker_in_edit_view(self):
         assign_perm_to_user(Errand, self.user_without_errands, 'assign_users')
         assign_perm_to_user(Errand, self.user_without_errands, 'can_list_and_view_every_errand')
         self.client.login(
@@ -416,8 +1117,10 @@ class ErrandEditTest(TestCase):
         )
         user1_errand = Errand.objects.filter(assigned_users=self.user1_with_errands.id).first()
         response = self.client.get(reverse('errands:detail', args=(user1_errand.id,)), follow=True)
-        for u in User.objects.all():
+        for u in user1_errand.assigned_users.all():
             self.assertContains(response, u.username, status_code=200, count=1)
+        self.assertNotContains(response, self.user_with_permission_to_view_and_list_all_errands.username)
+        self.assertContains(response, f'data-autocomplete-url="{reverse("accounts:autocomplete")}"')
 
     def test_assigned_users_without_correct_permission_cant_view_users_to_assign(self):
         self.client.login(
@@ -586,7 +1289,7 @@ class ErrandHistoryTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['content-type'], 'text/csv')
 
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         csv_reader = csv.reader(io.StringIO(content))
         body = list(csv_reader)
         headers = body.pop(0)
@@ -614,6 +1317,35 @@ class ErrandHistoryTest(TestCase):
         self.assertEqual(headers, field_names)
         self.assertEqual(body, rows)
 
+    def test_errand_history_csv_is_streamed_in_chunks(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        for i in range(3):
+            errand.status = i
+            errand.save()
+
+        response = self.client.get(reverse('errands:export_history_csv', args=(errand.id,)))
+        self.assertTrue(response.streaming)
+
+        chunks = list(response.streaming_content)
+        self.assertEqual(chunks[0].decode('utf-8').strip(), ','.join([
+            'id', 'name', 'description', 'status', 'assigned_users',
+            'change_date', 'change_reason', 'change_type', 'user_committing_change'
+        ]))
+        body = list(csv.reader(io.StringIO(b''.join(chunks[1:]).decode('utf-8'))))
+        self.assertEqual(len(body), errand.history.count())
+
+    def test_history_csv_of_missing_errand_returns_404(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        response = self.client.get(reverse('errands:export_history_csv', args=(0,)))
+        self.assertEqual(response.status_code, 404)
+
     def test_user_with_proper_permission_can_view_errand_history_table(self):
         self.client.login(
             username=user1_with_errands_data['username'],
@@ -626,6 +1358,80 @@ class ErrandHistoryTest(TestCase):
         self.assertIn('<button id="mapDisplayBtn"', str(response.content))
         self.assertEqual(list(response.context['field_names']), list(errand.history.first()._meta.get_fields()))
 
+    def test_errand_detail_query_count_does_not_grow_with_history(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+
+        def count_detail_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        count_detail_queries()
+        invalidate_errand_detail(errand.id)
+        short_history_queries = count_detail_queries()
+        for i in range(10):
+            errand.assigned_users.add(self.user2)
+            errand.assigned_users.remove(self.user2)
+            errand.status = i % 5
+            errand.save()
+        self.assertEqual(count_detail_queries(), short_history_queries)
+
+    def test_errand_detail_does_not_render_history_rows(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        response = self.client.get(reverse('errands:detail', args=(errand.id,)))
+        self.assertNotIn('history_records', response.context)
+        self.assertContains(response, reverse('errands:history', args=(errand.id,)))
+
+    def test_errand_history_is_served_in_pages(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        for i in range(55):
+            errand.status = i % 5
+            errand.save()
+
+        first_page = self.client.get(reverse('errands:history', args=(errand.id,)))
+        self.assertTemplateUsed(first_page, 'errands/history_rows.html')
+        first_ids = [h.history_id for h in first_page.context['history_records']]
+        self.assertEqual(first_ids, list(errand.history.values_list('history_id', flat=True)[:50]))
+        self.assertContains(first_page, 'data-next-url')
+
+        second_page = self.client.get(
+            reverse('errands:history', args=(errand.id,)), {'after': first_page.context['page_obj'].next_cursor}
+        )
+        second_ids = [h.history_id for h in second_page.context['history_records']]
+        self.assertEqual(first_ids + second_ids, list(errand.history.values_list('history_id', flat=True)))
+        self.assertNotContains(second_page, 'data-next-url')
+
+    def test_user_without_proper_permission_cant_fetch_errand_history(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        errand = self.errands_with_assigned_user1[0]
+        response = self.client.get(reverse('errands:history', args=(errand.id,)))
+        self.assertEqual(response.status_code, 403)
+
+    def test_errand_history_respects_errand_visibility(self):
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+        other_errand = create_errand('not assigned', 'errand')
+        response = self.client.get(reverse('errands:history', args=(other_errand.id,)))
+        self.assertEqual(response.status_code, 404)
+
     def test_user_without_proper_permissions_cant_view_errand_history_table(self):
         self.client.login(
             username=user3['username'],
@@ -649,6 +1455,99 @@ class ErrandHistoryTest(TestCase):
         self.assertTemplateUsed(response, 'accounts/login.html')
 
 
+class BulkHistoryExportTest(TestCase):
+
+    def setUp(self):
+        self.auditor = create_user(
+            username=user1_with_errands_data['username'],
+            email=user1_with_errands_data['email'],
+            password=user1_with_errands_data['password']
+        )
+        self.assignee = create_user(
+            username=user3['username'],
+            email=user3['email'],
+            password=user3['password']
+        )
+        assign_perm_to_user(Errand, self.auditor, 'access_history')
+        assign_perm_to_user(Errand, self.auditor, 'can_list_and_view_every_errand')
+
+        self.pending_errand = create_errand('pending errand', 'description')
+        self.done_errand = create_errand('done errand', 'description', status=4)
+        assign_users_to_errands([self.done_errand], [self.assignee])
+        self.done_errand.save()
+
+        self.client.login(
+            username=user1_with_errands_data['username'],
+            password=user1_with_errands_data['password']
+        )
+
+    def export(self, **params):
+        response = self.client.get(reverse('errands:export_history'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_export_covers_every_errand(self):
+        records = [json.loads(line) for line in self.export(format='ndjson').decode('utf-8').splitlines()]
+        self.assertEqual(len(records), Errand.history.count())
+        self.assertEqual({r['id'] for r in records}, {self.pending_errand.id, self.done_errand.id})
+
+    def test_export_can_be_filtered_by_status_and_assignee(self):
+        records = [json.loads(line) for line in self.export(format='ndjson', status=4).decode('utf-8').splitlines()]
+        self.assertEqual({r['id'] for r in records}, {self.done_errand.id})
+
+        records = [
+            json.loads(line)
+            for line in self.export(format='ndjson', assignee=self.assignee.id).decode('utf-8').splitlines()
+        ]
+        self.assertEqual(len(records), self.done_errand.history.filter(
+            historicalerrand_assigned_users__user=self.assignee).count()
+        )
+        self.assertTrue(all(r['assigned_users'] == [self.assignee.username] for r in records))
+
+    def test_export_can_be_filtered_by_date_range(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.assertEqual(self.export(format='ndjson', date_from=tomorrow.isoformat()), b'')
+
+        body = list(csv.reader(io.StringIO(self.export(date_to=tomorrow.isoformat()).decode('utf-8'))))
+        self.assertEqual(len(body) - 1, Errand.history.count())
+
+    @unittest.skipUnless(arrow_available(), 'pyarrow is not installed')
+    def test_parquet_export_is_readable(self):
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(self.export(format='parquet')))
+        self.assertEqual(table.num_rows, Errand.history.count())
+        self.assertIn('assigned_users', table.column_names)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse('errands:export_history'), {'date_from': '2023-02-02', 'date_to': '2023-02-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_respects_errand_visibility(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        assign_perm_to_user(Errand, self.assignee, 'access_history')
+        records = [json.loads(line) for line in self.export(format='ndjson').decode('utf-8').splitlines()]
+        self.assertEqual({r['id'] for r in records}, {self.done_errand.id})
+
+    def test_user_without_proper_permission_cant_export_history(self):
+        self.client.login(
+            username=user3['username'],
+            password=user3['password']
+        )
+        response = self.client.get(reverse('errands:export_history'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_management_command_writes_export_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.ndjson')
+            call_command('export_history', format='ndjson', status=[1], output=path)
+            with open(path) as export_file:
+                records = [json.loads(line) for line in export_file]
+        self.assertEqual({r['id'] for r in records}, {self.pending_errand.id})
+
+
 class FormTest(TestCase):
 
     def setUp(self):
@@ -694,6 +1593,23 @@ class FormTest(TestCase):
         )
         self.assertFalse(form.is_valid())
 
+    def test_assigned_users_widget_renders_only_selected_users(self):
+        form = DetailEditForm(initial={'assigned_users': [self.user1.id]}, for_user=self.user_with_add_user_perm)
+        html = str(form['assigned_users'])
+        self.assertIn(self.user1.username, html)
+        self.assertNotIn(self.user_with_add_user_perm.username, html)
+
+    def test_assigned_users_are_validated_in_one_query(self):
+        form = CreateErrandForm({
+            'assigned_users': [self.user1.id, self.user_with_add_user_perm.id],
+            'name': 'test name',
+            'description': 'test errand description',
+            'address': 'test address',
+            'geolocation': '12,124|13.125',
+        })
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+
     def test_correctly_filled_out_creation_form_is_valid(self):
         errand_details_form_data = {
             'assigned_users': [self.user1.id, ],
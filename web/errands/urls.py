@@ -1,13 +1,25 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = 'errands'
 urlpatterns = [
     path('', views.UserErrandsList.as_view(), name='index'),
     path('<int:pk>/', views.DetailErrandView.as_view(), name='detail'),
+    path('<int:pk>/history/', views.ErrandHistoryView.as_view(), name='history'),
     path('<int:pk>/update/', views.update, name='update'),
+    path('search/', views.search, name='search'),
+    path('nearby/', views.nearby, name='nearby'),
+    path('within/', views.within, name='within'),
+    path('map/', views.ErrandMapView.as_view(), name='map'),
+    path('map/clusters/', views.map_clusters, name='map_clusters'),
+    path('route/', views.RoutePlanView.as_view(), name='route'),
+    path('geocode/', views.geocode, name='geocode'),
     path('new/', views.CreateErrandView.as_view(), name='new'),
     path('create/', views.create, name='create'),
-    path('<int:pk>/export_history_csv/', views.csv_history, name='export_history_csv')
+    path('<int:pk>/export_history_csv/', views.csv_history, name='export_history_csv'),
+    path('export_history/', views.export_history, name='export_history'),
+    path('api/', async_views.errand_list, name='api_list'),
+    path('api/<int:pk>/', async_views.errand_detail, name='api_detail'),
+    path('api/<int:pk>/history/', async_views.errand_history, name='api_history'),
 ]
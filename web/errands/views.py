@@ -1,21 +1,34 @@
-import csv
-
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required, permission_required
-from django.views.generic import CreateView, ListView, DetailView
+from django.views.generic import CreateView, ListView, DetailView, TemplateView
 from django.views.generic.edit import FormMixin
 from django.shortcuts import redirect, render, get_object_or_404
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.postgres.aggregates import ArrayAgg
 from django.conf import settings
-from django.apps import apps
-from django.db.models import Subquery, OuterRef
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from errander.conditional import conditional_page
+from errander.db.replicas import replica_reads, replica_reads_enabled, use_replica
+from errander.pagination import KeysetPaginationMixin
 
-from .models import Errand
-from .forms import DetailEditForm, CreateErrandForm
+from .models import Errand, SEARCH_CONFIG
+from .clusters import clusters_for_bounds
+from .detail_cache import (
+    DETAIL_CACHE_TIMEOUT, can_view_errand, errand_detail, history_fragment_cache_key, invalidate_errand_detail,
+)
+from .routing import plan_route
+from .geocoding import get_geocoding_service
+from .forms import (
+    DetailEditForm, CreateErrandForm, ErrandFilterForm, HistoryExportForm, NearbyErrandsForm, BoundingBoxForm
+)
+from .exports import (
+    EXPORT_FORMATS, HISTORY_FIELD_NAMES, filter_history, history_rows, stream_csv, stream_history, with_assigned_usernames
+)
 
 from simple_history.utils import update_change_reason
 
@@ -34,26 +47,73 @@ class CreateErrandView(LoginRequiredMixin, CreateView):
         return context
 
 
-class UserErrandsList(LoginRequiredMixin, ListView):
+def latest_errand_change(request, *args, **kwargs):
+    return Errand.history.order_by('-history_date').values_list('history_date', 'history_id').first()
+
+
+def request_errand_detail(request, pk):
+    # the ETag check and the view share one lookup of the errand's latest history_id
+    details = request.__dict__.setdefault('_errand_details', {})
+    if pk not in details:
+        details[pk] = errand_detail(pk)
+    return details[pk]
+
+
+def errand_detail_change(request, pk):
+    detail = request_errand_detail(request, pk)
+    if detail is None or detail['last_change'] is None or not can_view_errand(request.user, detail):
+        return None
+    return detail['last_change'].history_date, detail['history_id']
+
+
+@method_decorator(use_replica, name='dispatch')
+@conditional_page(latest_errand_change)
+class UserErrandsList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'errands/index.html'
     context_object_name = 'errands'
+    paginate_by = 25
+    keyset_ordering = ('status', 'id')
 
     def get_queryset(self):
-        if self.request.user.has_perm('errands.can_list_and_view_every_errand'):
-            return Errand.objects.all()
+        queryset = Errand.objects.visible_to(self.request.user)
+
+        self.filter_form = ErrandFilterForm(self.request.GET)
+        if self.filter_form.is_valid():
+            if self.filter_form.cleaned_data['q']:
+                queryset = queryset.search(self.filter_form.cleaned_data['q'])
+            if self.filter_form.cleaned_data['status']:
+                queryset = queryset.filter(status__in=self.filter_form.cleaned_data['status'])
+            if self.filter_form.cleaned_data['assignee']:
+                queryset = queryset.filter(assigned_users=self.filter_form.cleaned_data['assignee'])
+        return queryset
 
-        return Errand.objects.filter(assigned_users__in=[self.request.user.id])
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        context['active_statuses'] = Errand.ACTIVE_STATUSES
+        return context
 
 
+@method_decorator(use_replica, name='dispatch')
+@conditional_page(errand_detail_change)
 class DetailErrandView(FormMixin, LoginRequiredMixin, DetailView):
     model = Errand
     template_name = 'errands/detail.html'
     form_class = DetailEditForm
 
+    def get_object(self, queryset=None):
+        if getattr(self, 'object', None) is None:
+            self.detail = request_errand_detail(self.request, self.kwargs['pk'])
+            if self.detail is None or not can_view_errand(self.request.user, self.detail):
+                raise Http404('No errand found matching the query')
+            self.object = self.detail['errand']
+        return self.object
+
     def get_initial(self):
+        errand = self.get_object()
         return {
-            'assigned_users': self.get_object().assigned_users.all(),
-            'status': self.get_object().status,
+            'assigned_users': self.detail['assigned_user_ids'],
+            'status': errand.status,
         }
 
     def get_form_kwargs(self):
@@ -66,15 +126,52 @@ class DetailErrandView(FormMixin, LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['google_api_key'] = settings.GOOGLE_API_KEY
+        context['last_change'] = self.detail['last_change']
+        context['history_id'] = self.detail['history_id']
+        context['detail_cache_timeout'] = DETAIL_CACHE_TIMEOUT
         if self.request.user.has_perm('errands.access_history'):
-            context['field_names'] = context['errand'].history.first()._meta.get_fields()
+            context['field_names'] = Errand.history.model._meta.get_fields()
         return context
 
+
+@method_decorator(use_replica, name='dispatch')
+class ErrandHistoryView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    template_name = 'errands/history_rows.html'
+    context_object_name = 'history_records'
+    paginate_by = 50
+    keyset_ordering = ('-history_id',)
+
+    @method_decorator(permission_required('errands.access_history', raise_exception=True))
+    def dispatch(self, *args, **kwargs):
+        return super(ErrandHistoryView, self).dispatch(*args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        detail = errand_detail(self.kwargs['pk'])
+        if detail is None or not can_view_errand(request.user, detail):
+            raise Http404('No errand found matching the query')
+        self.errand = detail['errand']
+
+        key = history_fragment_cache_key(self.errand.id, detail['history_id'], request.GET.urlencode())
+        content = cache.get(key)
+        if content is None:
+            # a lagging replica must not cache a table missing the latest change under its history_id
+            from_replica = replica_reads_enabled() and (
+                detail['history_id'] is None or self.errand.history.filter(history_id=detail['history_id']).exists()
+            )
+            with replica_reads(from_replica):
+                response = super().get(request, *args, **kwargs)
+                response.render()
+            cache.set(key, response.content, DETAIL_CACHE_TIMEOUT)
+            return response
+        return HttpResponse(content)
+
     def get_queryset(self):
-        if self.request.user.has_perm('errands.can_list_and_view_every_errand'):
-            return Errand.objects.filter(id=self.kwargs['pk'])
+        return with_assigned_usernames(self.errand.history.select_related('history_user'))
 
-        return Errand.objects.filter(assigned_users__in=[self.request.user.id])
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['errand'] = self.errand
+        return context
 
 
 @login_required
@@ -90,17 +187,142 @@ def create(request):
         return redirect('errands:create')
 
 
+@login_required
+def search(request) -> JsonResponse:
+    query = request.GET.get('q', '').strip()[:100]
+    if not query:
+        return JsonResponse({'results': []})
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    errands = (
+        Errand.objects
+        .visible_to(request.user)
+        .search(query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query) + TrigramSimilarity('address', query))
+        .order_by('-rank', 'id')
+        .values('id', 'name', 'address', 'status')[:20]
+    )
+
+    return JsonResponse({'results': [
+        dict(errand, url=reverse('errands:detail', args=[errand['id']])) for errand in errands
+    ]})
+
+
+def errand_location_json(errand):
+    location = {
+        'id': errand.id,
+        'name': errand.name,
+        'address': errand.address,
+        'status': errand.status,
+        'latitude': errand.latitude,
+        'longitude': errand.longitude,
+        'url': reverse('errands:detail', args=[errand.id]),
+    }
+    if hasattr(errand, 'distance'):
+        location['distance_km'] = round(errand.distance, 3)
+    return location
+
+
+@login_required
+def nearby(request) -> JsonResponse:
+    form = NearbyErrandsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    errands = (
+        Errand.objects
+        .visible_to(request.user)
+        .nearby(form.cleaned_data['lat'], form.cleaned_data['lng'], form.cleaned_data['radius'])
+        .only('id', 'name', 'address', 'status', 'latitude', 'longitude')[:50]
+    )
+    return JsonResponse({'results': [errand_location_json(errand) for errand in errands]})
+
+
+@login_required
+def within(request) -> JsonResponse:
+    form = BoundingBoxForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    errands = (
+        Errand.objects
+        .visible_to(request.user)
+        .within(**form.cleaned_data)
+        .only('id', 'name', 'address', 'status', 'latitude', 'longitude')
+        .order_by('id')[:500]
+    )
+    return JsonResponse({'results': [errand_location_json(errand) for errand in errands]})
+
+
+class ErrandMapView(LoginRequiredMixin, TemplateView):
+    template_name = 'errands/map.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['google_api_key'] = settings.GOOGLE_API_KEY
+        return context
+
+
+@login_required
+def map_clusters(request) -> JsonResponse:
+    form = BoundingBoxForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        zoom = int(request.GET.get('zoom', 0))
+    except ValueError:
+        return JsonResponse({'errors': {'zoom': ['Enter a whole number.']}}, status=400)
+
+    if request.user.has_perm('errands.can_list_and_view_every_errand'):
+        scope = 'all'
+    else:
+        scope = f'user{request.user.id}'
+    zoom, clusters = clusters_for_bounds(Errand.objects.visible_to(request.user), scope, zoom=zoom, **form.cleaned_data)
+
+    for cluster in clusters:
+        if cluster['errand_id'] is not None:
+            cluster['url'] = reverse('errands:detail', args=[cluster['errand_id']])
+    return JsonResponse({'zoom': zoom, 'clusters': clusters})
+
+
+class RoutePlanView(LoginRequiredMixin, TemplateView):
+    template_name = 'errands/route.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        origin = None
+        form = NearbyErrandsForm(self.request.GET)
+        if form.is_valid():
+            origin = (form.cleaned_data['lat'], form.cleaned_data['lng'])
+        context['stops'], context['total_km'] = plan_route(self.request.user, origin)
+        context['origin'] = origin
+        return context
+
+
+@login_required
+@permission_required(perm='errands.create', raise_exception=True)
+def geocode(request) -> JsonResponse:
+    address = request.GET.get('address', '').strip()[:200]
+    point = get_geocoding_service().geocode(address) if address else None
+    if point is None:
+        return JsonResponse({'result': None})
+    return JsonResponse({'result': {'latitude': point[0], 'longitude': point[1]}})
+
+
 @login_required
 def update(request, pk: int):
     if request.method == 'POST':
         errand = get_object_or_404(Errand, pk=pk)
         form = DetailEditForm(request.POST)
         if form.is_valid():
-            if request.user.has_perm('errands.assign_users'):
-                errand.assigned_users.set(form.cleaned_data['assigned_users'])
-            errand.status = request.POST['status']
-            errand.save()
-            update_change_reason(errand, request.POST['change_reason'])
+            # the new history records only become visible together with the change reason
+            with transaction.atomic():
+                if request.user.has_perm('errands.assign_users'):
+                    errand.assigned_users.set(form.cleaned_data['assigned_users'])
+                errand.status = request.POST['status']
+                errand.save()
+                update_change_reason(errand, request.POST['change_reason'])
+                transaction.on_commit(lambda: invalidate_errand_detail(errand.id))
             messages.success(request, message='Errand updated')
             return HttpResponseRedirect(reverse('errands:detail', args=[errand.id]))
     else:
@@ -109,48 +331,40 @@ def update(request, pk: int):
 
 @login_required
 @permission_required(perm='errands.access_history', raise_exception=True)
-def csv_history(request, pk: int) -> HttpResponse:
-    HistoricalErrandAssignedUsers = apps.get_model('errands', 'historicalerrand_assigned_users')
+@use_replica
+def csv_history(request, pk: int) -> StreamingHttpResponse:
+    errand = get_object_or_404(Errand, pk=pk)
 
-    errand_history = (
-        Errand.objects
-        .get(pk=pk)
-        .history.all()
-        .annotate(
-            assigned_users_list=Subquery(
-                HistoricalErrandAssignedUsers.objects
-                .filter(history_id=OuterRef('history_id'))
-                .values('history_id')
-                .annotate(usernames=ArrayAgg('user__username', distinct=True))
-                .values('usernames')
-            )
-        )
+    return StreamingHttpResponse(
+        stream_csv(HISTORY_FIELD_NAMES, history_rows(errand.history.all())),
+        content_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="errand_history.csv"'},
     )
 
-    field_names = [
-        'id', 'name', 'description', 'status', 'assigned_users',
-        'change_date', 'change_reason', 'change_type', 'user_committing_change'
-    ]
 
-    response = HttpResponse(
-        content_type='text/csv',
-        headers={'Content-Disposition': 'attachment; filename="errand_history.csv"'},
+@login_required
+@permission_required(perm='errands.access_history', raise_exception=True)
+@use_replica
+def export_history(request):
+    form = HistoryExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    history = Errand.history.all()
+    if not request.user.has_perm('errands.can_list_and_view_every_errand'):
+        history = history.filter(id__in=Errand.objects.visible_to(request.user).values('id'))
+    history = filter_history(
+        history,
+        date_from=form.cleaned_data['date_from'],
+        date_to=form.cleaned_data['date_to'],
+        statuses=form.cleaned_data['status'],
+        assignee=form.cleaned_data['assignee'],
+    ).order_by('history_id')
+
+    export_format = form.cleaned_data['format']
+    content_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingHttpResponse(
+        stream_history(history, export_format),
+        content_type=content_type,
+        headers={'Content-Disposition': f'attachment; filename="errands_history.{extension}"'},
     )
-    writer = csv.writer(response)
-    writer.writerow(field_names)
-
-    for history in errand_history:
-
-        writer.writerow([
-            history.id,
-            history.name,
-            history.description,
-            history.status,
-            history.assigned_users_list,
-            history.history_date,
-            history.history_change_reason,
-            history.history_type,
-            history.history_user
-        ])
-
-    return response
@@ -1,5 +1,114 @@
+import gc
+import math
 import multiprocessing
+import os
+import shutil
 
-workers = multiprocessing.cpu_count() * 2 + 1
+CGROUP_ROOT = '/sys/fs/cgroup'
+MIB = 1024 * 1024
+
+
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+def read_cgroup_file(*path):
+    try:
+        with open(os.path.join(CGROUP_ROOT, *path)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    # cgroup v2 exposes "<quota> <period>", v1 splits them into two files
+    cpu_max = read_cgroup_file('cpu.max')
+    if cpu_max:
+        quota, period = cpu_max.split()
+        return None if quota == 'max' else int(quota) / int(period)
+
+    quota, period = read_cgroup_file('cpu', 'cpu.cfs_quota_us'), read_cgroup_file('cpu', 'cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory_limit():
+    limit = read_cgroup_file('memory.max') or read_cgroup_file('memory', 'memory.limit_in_bytes')
+    if not limit or limit == 'max' or int(limit) >= 2 ** 60:
+        return None
+    return int(limit)
+
+
+def available_cpus():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else multiprocessing.cpu_count()
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def default_workers():
+    workers = available_cpus() * 2 + 1
+    memory_limit = cgroup_memory_limit()
+    if memory_limit is not None:
+        workers = min(workers, memory_limit // (int(os.environ.get('GUNICORN_WORKER_MEMORY_MB', 150)) * MIB))
+    return max(workers, 1)
+
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('GUNICORN_WORKERS') or default_workers())
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+preload_app = env_bool('GUNICORN_PRELOAD')
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
 errorlog = '-'
-loglevel = 'info'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    # samples left by the previous master would be added to the new workers' totals
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def when_ready(server):
+    server.log.info('Starting %s %s workers (%s threads each)', workers, worker_class, threads)
+    if preload_app:
+        # keep objects created while preloading out of the collector, so forked
+        # workers do not touch (and copy) the pages shared with the master
+        gc.freeze()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from django.db import connections
+        from errander.db.pool import close_pools
+
+        connections.close_all()
+        # close_all() hands pooled connections back to the master's pool, and every
+        # worker would inherit their sockets
+        close_pools()
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed, database calls will block gevent workers')
+        else:
+            patch_psycopg()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
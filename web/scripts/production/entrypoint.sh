@@ -1,2 +1,6 @@
 #!/bin/sh
-/opt/venv/bin/gunicorn --worker-tmp-dir /dev/shm errander.wsgi:application --bind "0.0.0.0:${APP_PORT:-8000}"
\ No newline at end of file
+/opt/venv/bin/python3 manage.py check --deploy --fail-level ERROR || exit 1
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+  exec /opt/venv/bin/gunicorn --worker-tmp-dir /dev/shm -k uvicorn.workers.UvicornWorker errander.asgi:application --bind "0.0.0.0:${APP_PORT:-8000}"
+fi
+exec /opt/venv/bin/gunicorn --worker-tmp-dir /dev/shm errander.wsgi:application --bind "0.0.0.0:${APP_PORT:-8000}"
\ No newline at end of file